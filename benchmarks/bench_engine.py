@@ -0,0 +1,220 @@
+"""
+microbenchmarks for the engine's hot paths, at a few lobby sizes
+
+every benchmark builds its game untimed, then times only the call being measured. results are microseconds per
+operation (per player joined, per command, per lookup, ...), written out as json so runs can be compared
+
+    python benchmarks/bench_engine.py --output before.json
+    python benchmarks/bench_engine.py --output after.json --compare before.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from opendere import game  # noqa: E402
+
+
+CHANNEL = '#bench'
+SIZES = [5, 50, 500, 5000]
+
+
+def lobby(num_players, seed=0):
+    g = game.Game(CHANNEL, 'opendere', 'opendere', seed=seed)
+    for i in range(num_players):
+        g.join_game(f"player{i}!bench@bench", f"player{i}")
+    return g
+
+
+def day(num_players, seed=0):
+    """
+    a game that has just started its first day, with nobody having voted yet
+    """
+    g = lobby(max(num_players, 4), seed)
+    g._phase_change()
+    while g.phase_name != 'day':
+        g._phase_change()
+    return g
+
+
+def voted(num_players, seed=0):
+    """
+    a day where everyone has voted for the next player along, so there's a full ballot and queue of vote actions
+    """
+    g = day(num_players, seed)
+    alive = list(g.alive.values())
+    for i, user in enumerate(alive):
+        g.user_action(user.uid, f"!vote {alive[(i + 1) % len(alive)].nick}", CHANNEL)
+    return g
+
+
+def bench_join_game(n):
+    g = game.Game(CHANNEL, 'opendere', 'opendere', seed=0)
+    players = [(f"player{i}!bench@bench", f"player{i}") for i in range(n)]
+
+    def run():
+        for uid, nick in players:
+            g.join_game(uid, nick)
+    return run, n
+
+
+def bench_user_action(n):
+    g = day(n)
+    alive = list(g.alive.values())
+    commands = [(user.uid, f"!vote {alive[(i + 1) % len(alive)].nick}") for i, user in enumerate(alive)]
+
+    def run():
+        for uid, command in commands:
+            g.user_action(uid, command, CHANNEL)
+    return run, len(commands)
+
+
+def bench_get_user(n):
+    g = day(n)
+    nicks = [user.nick for user in g.alive.values()]
+
+    def run():
+        for nick in nicks:
+            g.get_user(nick, prefix=True)
+    return run, len(nicks)
+
+
+def bench_list_votes(n):
+    g = voted(n)
+
+    def run():
+        for _ in range(100):
+            g.list_votes
+    return run, 100
+
+
+def bench_tally_votes(n):
+    g = voted(n)
+
+    def run():
+        for _ in range(100):
+            g.tally_votes()
+    return run, 100
+
+
+def bench_process_phase_actions(n):
+    g = voted(n)
+    return g._process_phase_actions, len(g.phase_actions)
+
+
+def bench_phase_change(n):
+    g = voted(n)
+    return g._phase_change, 1
+
+
+def bench_nick_change(n):
+    # every player changes nick and host once, mid-day, with all their votes in
+    g = voted(n)
+    changes = [(user.uid, f"{user.nick}_!bench@elsewhere", user.nick, f"{user.nick}_") for user in list(g.alive.values())]
+
+    def run():
+        for change in changes:
+            g._nick_change(*change)
+    return run, len(changes)
+
+
+def bench_tick_idle_games(n):
+    # n lobbies waiting for their start timer, none of which are due
+    games = [lobby(4, seed=i) for i in range(n)]
+
+    def run():
+        for g in games:
+            g.tick()
+    return run, n
+
+
+benchmarks = {
+    'join_game': bench_join_game,
+    'user_action': bench_user_action,
+    'get_user': bench_get_user,
+    'list_votes': bench_list_votes,
+    'tally_votes': bench_tally_votes,
+    '_process_phase_actions': bench_process_phase_actions,
+    '_phase_change': bench_phase_change,
+    'nick_change': bench_nick_change,
+    'tick_idle_games': bench_tick_idle_games,
+}
+
+
+def measure(bench, n, repeat):
+    """
+    time bench at size n, building it from scratch for every repeat since most benchmarks use their game up
+    """
+    timings = []
+    for _ in range(repeat):
+        run, ops = bench(n)
+        gc.collect()
+        started = time.perf_counter_ns()
+        run()
+        elapsed = time.perf_counter_ns() - started
+        timings.append(elapsed / 1000 / max(ops, 1))
+    return {'ops': ops, 'us_per_op_min': round(min(timings), 3), 'us_per_op_median': round(statistics.median(timings), 3)}
+
+
+def run_all(sizes=SIZES, repeat=5, only=None):
+    results = {}
+    for name, bench in benchmarks.items():
+        if only and name not in only:
+            continue
+        results[name] = {str(n): measure(bench, n, repeat) for n in sizes}
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    the (benchmark, size, ratio) of every median that got slower than threshold times the baseline's
+    """
+    regressions = []
+    for name, sizes in current['results'].items():
+        for n, result in sizes.items():
+            before = baseline['results'].get(name, {}).get(n)
+            if not before or not before['us_per_op_median']:
+                continue
+            ratio = result['us_per_op_median'] / before['us_per_op_median']
+            if ratio > threshold:
+                regressions.append((name, n, round(ratio, 2)))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help='comma separated player counts')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', help='comma separated benchmark names, all of them by default')
+    parser.add_argument('--output', help='write the results here as well as to stdout')
+    parser.add_argument('--compare', help='a previous --output to compare against, exits 1 if anything regressed')
+    parser.add_argument('--threshold', type=float, default=1.25, help='how much slower counts as a regression')
+    args = parser.parse_args(argv)
+
+    results = run_all([int(n) for n in args.sizes.split(',')], args.repeat, args.only and args.only.split(','))
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for name, n, ratio in regressions:
+            print(f"regression: {name} at {n} players is {ratio}x slower", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
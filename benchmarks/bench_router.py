@@ -0,0 +1,122 @@
+"""
+how fast lines from a busy channel are routed or dropped
+
+a stream of mostly chatter, some of it other bots' ! commands, with a few game commands mixed in, is fed through:
+- legacy: the old catch-all ^!.+ rule followed by the old lstrip and split parsing
+- pattern: the sopel rule compiled from the router's table, which is all sopel itself runs for chatter
+- parse: Router.parse on every line
+- server: GameServer.message on every line, with a game running in the channel
+results are nanoseconds per line, as json
+
+    python benchmarks/bench_router.py --lines 200000 --game-share 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from opendere import roles, router, server  # noqa: E402
+
+
+CHANNEL = '#opendere'
+CHATTER = [
+    'lol', 'did anyone see the match last night?', 'brb', 'i think kitties is the yandere tbh', 'hello everyone',
+    'can someone help me with my code', 'this is fine', 'ok', 'haha yes', 'no way that happened',
+]
+BOT_COMMANDS = ['!weather london', '!seen kitties', '!tell doggo hi', '!roll 2d6', '!wiki yandere', '!8ball will i win?']
+
+
+def stream(num_lines, game_share, bot_share=0.1, num_players=12, seed=0):
+    """
+    (uid, nick, text) lines from a channel where game_share of the lines are game commands
+    """
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(num_lines):
+        i = rng.randrange(num_players)
+        roll = rng.random()
+        if roll < game_share:
+            text = rng.choice([f"!vote player{rng.randrange(num_players)}", '!hurry', '!help', '!u', '!players'])
+        elif roll < game_share + bot_share:
+            text = rng.choice(BOT_COMMANDS)
+        else:
+            text = rng.choice(CHATTER)
+        lines.append((f"player{i}!bench@bench", f"player{i}", text))
+    return lines
+
+
+def legacy(text, prefix='!', name='opendere'):
+    # what a line cost before the router: the catch-all rule, then Game.user_action's parsing
+    if not re.match(f"^{prefix}.+", text):
+        return None
+    action = text.lstrip(prefix).lstrip('opendere').lstrip(name).split(maxsplit=1)
+    command = action[0].lower() if action else None
+    if command != 'help' and command not in roles.all_commands:
+        return None
+    return command, action[1:]
+
+
+def time_per_line(fn, lines):
+    started = time.perf_counter_ns()
+    for line in lines:
+        fn(line)
+    return (time.perf_counter_ns() - started) / len(lines)
+
+
+def run(num_lines=200000, game_share=0.05, seed=0):
+    lines = stream(num_lines, game_share, seed=seed)
+    texts = [text for _, _, text in lines]
+    r = router.Router('!', [CHANNEL.lstrip('#')])
+    pattern = re.compile(r.pattern)
+
+    results = {
+        'legacy': time_per_line(legacy, texts),
+        'pattern': time_per_line(pattern.match, texts),
+        'parse': time_per_line(r.parse, texts),
+    }
+
+    async def serve():
+        s = server.GameServer()
+        local = server.LocalAdapter(s, [CHANNEL])
+        task = asyncio.ensure_future(s.serve())
+        await asyncio.sleep(0)
+        for i in range(12):
+            local.say(f"player{i}!bench@bench", f"player{i}", '!opendere', CHANNEL)
+        s.games[CHANNEL]._phase_change()
+        results['server'] = time_per_line(lambda line: s.message(*line, CHANNEL), lines)
+        s.stop()
+        await task
+
+    asyncio.run(serve())
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'lines': num_lines,
+        'game_share': game_share,
+        'ns_per_line': {name: round(ns, 1) for name, ns in results.items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--game-share', type=float, default=0.05, help='the share of lines that are game commands')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results here as well as to stdout')
+    args = parser.parse_args(argv)
+
+    results = run(args.lines, args.game_share, args.seed)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,155 +2,151 @@
 # coding=utf-8
 """opendere sopel frontend module"""
 
-import os, sys
-from sopel.module import commands, interval, rule, example
+import asyncio, logging, os, sys, threading
+from sopel.module import commands, event, interval, rule, example, require_privmsg, thread
 sys.path.append(os.getcwd())
-import opendere.game
-import opendere.roles
+import opendere.metrics
+import opendere.outbox
+import opendere.recorder
+import opendere.router
+import opendere.server
+import opendere.shard
+import opendere.snapshot
 
 opendere_channels = ['#opendere']
 command_prefix = '!'
+journal_dir = None  # a directory to keep a replayable journal of every game in, see opendere.journal
+snapshot_dir = 'opendere-snapshots'  # where running games are saved to survive restarts, relative to sopel's homedir. None to disable
+flood_rate = 1.0  # messages per second the bot sends once flood_burst is used up, keep it under the network's flood limit
+flood_burst = 5  # messages the bot can send back to back
+metrics_file = 'opendere.prom'  # prometheus text-format metrics, rewritten every 15 seconds, relative to sopel's homedir. None to disable
+shards = 0  # worker processes to spread the games over, see opendere.shard. 0 to run every game in the sopel process
+slow_phase_dir = 'opendere-slow'  # where phase changes slower than slow_phase_seconds are captured, relative to sopel's homedir. None to disable
+slow_phase_seconds = 1.0
+stats_admins = []  # hostmasks allowed to use !stats on top of sopel's owner and admins, e.g. '*!*@staff.example.org'
+
+log = logging.getLogger(__name__)
 
 def bold(msg):
     return f"\x02{msg}\x0f"
 
-def setup(bot=None):
-    if not bot:
-        return
-    bot.memory['opendere_channels'] = opendere_channels
-    bot.memory['games'] = dict()
-
-@interval(0.1)
-def tick(bot):
-    """
-    tick down the timer for game state, i.e. the start timer or hurry timer
+def submit(server, fn, *args):
     """
-    for channel in bot.channels:
-        if channel not in bot.memory['games']:
-            continue
-
-        try:
-            messages = bot.memory['games'][channel].tick()
-        except opendere.game.InsufficientPlayersError:
-            bot.say(bold(f"there aren't enough players to start a game of opendere in {channel}. please try again later."), channel)
-            del bot.memory['games'][channel]
-            continue
-
-        if not messages:
-            continue
-
-        for recipient, text in messages:
-            if recipient in bot.memory['opendere_channels']:
-                bot.say(bold(text), recipient)
-            else:
-                bot.notice(text, recipient.split('!')[0])
-
-        # if the game has ended or been reset
-        if bot.memory['games'][channel].channel is None:
-            del bot.memory['games'][channel]
-
-@rule(f"^{command_prefix}(e$|end|r$|reset|restart)")
-@example('!end - end/reset the current game')
-def reset(bot, trigger):
-    """
-    reset the game state if it's borked
+    hand fn(*args) over to the server. nothing waits on what it returns, so anything it raises is logged here
+    instead of vanishing with the future
     """
-    if trigger.sender not in bot.memory['games']:
-        return
-    bot.memory['games'][trigger.sender].reset()
-    del bot.memory['games'][trigger.sender]
-    bot.say(bold(f"the current game in {trigger.sender} has been ended or reset."), trigger.sender)
+    future = server.submit(fn, *args)
+    if future is not None:
+        future.add_done_callback(log_failure)
 
-@rule(f"{command_prefix}(!opendere|{'|'.join([channel.lstrip('#') for channel in opendere_channels])})")
-@example('!opendere - join an existing (or start a new) game in #opendere')
-def join_game(bot, trigger):
+def log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        log.error("opendere failed to handle a line", exc_info=future.exception())
+
+class SopelAdapter(opendere.server.Adapter):
     """
-    join an existing (or start a new) opendere instance
+    everything the games say goes through one paced queue, see opendere.outbox
     """
-    if trigger.sender not in bot.memory['opendere_channels']:
-        # bot.say(f"you can only join or start a game from {' or '.join(bot.memory['opendere_channels'])}")
-        return
-
-    # if no game exists, we need to start one
-    if trigger.sender not in bot.memory['games']:
-        bot.memory['games'][trigger.sender] = opendere.game.Game(trigger.sender, bot.nick, trigger.sender.lstrip('#'), command_prefix)
-
-    # if one does exist, we can then join the player to it
-    for recipient, text in bot.memory['games'][trigger.sender].join_game(trigger.hostmask, trigger.nick):
-        if recipient in bot.memory['opendere_channels']:
-            bot.say(bold(text), recipient)
+    def __init__(self, server, bot):
+        super().__init__(server, opendere_channels, bot.nick)
+        self.bot = bot
+        self.outbox = opendere.outbox.Outbox(self.channels, flood_rate, flood_burst)
+
+    def send(self, messages):
+        self.outbox.put(messages)
+
+    def deliver(self, recipient, text, is_channel):
+        opendere.metrics.default.inc('opendere_sent_total', kind='channel' if is_channel else 'private')
+        if is_channel:
+            self.bot.say(bold(text), recipient)
         else:
-            bot.notice(text, recipient.split('!')[0])
+            self.bot.notice(text, recipient.split('!')[0])
 
-@rule(f"^{command_prefix}(extend)")
-@example('!extend - give more time for people to join the game')
-def extend(bot, trigger):
-    if trigger.sender not in bot.memory['games']:
+def setup(bot=None):
+    if not bot:
         return
-    for recipient, text in bot.memory['games'][trigger.sender].user_extend(trigger.hostmask):
-        if recipient in bot.memory['opendere_channels']:
-            bot.say(bold(text), recipient)
-        else:
-            bot.notice(text, recipient.split('!')[0])
-
-@rule(f"^{command_prefix}(h$|hurry|hayaku)")
+    snapshot_path = snapshot_dir and os.path.join(bot.config.core.homedir, snapshot_dir)
+    metrics_path = metrics_file and os.path.join(bot.config.core.homedir, metrics_file)
+    # sopel's owner and admins can use !stats too, sopel checks them against their accounts as trigger.admin, see relay
+    admins = stats_admins
+    recorder = slow_phase_dir and opendere.recorder.Recorder(os.path.join(bot.config.core.homedir, slow_phase_dir), slow_phase_seconds)
+    if shards:
+        server = opendere.shard.ShardedServer(shards, command_prefix, journal_dir, snapshot_path, admins, metrics_path, recorder)
+    else:
+        snapshots = snapshot_path and opendere.snapshot.SnapshotStore(snapshot_path)
+        server = opendere.server.GameServer(command_prefix, journal_dir, snapshots, admins, metrics_path=metrics_path, recorder=recorder)
+    adapter = SopelAdapter(server, bot)
+    bot.memory['opendere_server'] = server
+    bot.memory['opendere_adapter'] = adapter
+    bot.memory['opendere_outbox_stop'] = threading.Event()
+
+    if shards:
+        server.start()
+    else:
+        # the games all live on one event loop in its own thread, sopel's handler threads just hand lines over to it
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_until_complete, args=(server.serve(),), name='opendere-server', daemon=True).start()
+    threading.Thread(
+        target=adapter.outbox.run,
+        args=(adapter.deliver, bot.memory['opendere_outbox_stop']),
+        name='opendere-outbox',
+        daemon=True
+    ).start()
+
+def shutdown(bot):
+    bot.memory['opendere_server'].stop()
+    bot.memory['opendere_adapter'].outbox.stop(bot.memory['opendere_outbox_stop'])
+
+# one rule compiled from every command there is, so sopel never even calls us for chatter or other bots' commands
+@rule(opendere.router.Router(command_prefix, [channel.lstrip('#') for channel in opendere_channels]).pattern)
+@thread(False)
+@example('!opendere - join an existing (or start a new) game in #opendere')
+@example('!end - end/reset the current game')
+@example('!extend - give more time for people to join the game')
 @example('!hurry - vote to hurry the current phase')
-def hurry(bot, trigger):
-    if trigger.sender not in bot.memory['games']:
-        return
-    for recipient, text in bot.memory['games'][trigger.sender].user_hurry(trigger.hostmask):
-        if recipient in bot.memory['opendere_channels']:
-            bot.say(bold(text), recipient)
-        else:
-            bot.notice(text, recipient.split('!')[0])
-
-# alias for 'vote abstain' and 'vote undecided'
-@rule(f"^{command_prefix}(a$|u$|abstain|unvote)")
 @example('!unvote - change your vote to undecided')
-def unvote(bot, trigger):
-    if trigger.sender not in bot.memory['games']:
-        return
-    for recipient, text in bot.memory['games'][trigger.sender].user_action(trigger.hostmask,
-                                                                           f"vote {trigger.match.string.lstrip(command_prefix).split()[0]}",
-                                                                           channel=trigger.sender if trigger.sender != trigger.nick else None):
-        if recipient in bot.memory['opendere_channels']:
-            bot.say(bold(text), recipient)
-        else:
-            bot.notice(text, recipient.split('!')[0])
-
-@rule(f"^{command_prefix}[^$]+")
+@example('!players [page] - who is still alive, a page at a time')
+@example('!stats - timings and message counts, for admins')
 @example("!vote <target> - use an ability against a target (e.g. 'vote kitties' or 'kill kitties')")
-def actions(bot, trigger):
+def relay(bot, trigger):
+    """
+    hand every command, public or private, to the game server. it only queues the line, so there's no need for a thread
+    """
     # for sopel, trigger.sender is a channel if the message is sent via a channel, and a nick if the message is sent via privmsg
-    messages = list()
-    if trigger.sender in bot.memory['opendere_channels'] and trigger.sender not in bot.memory['games']:
-        if trigger.match.string.lstrip(command_prefix) in ['opendere', trigger.sender.lstrip('#')]:
-            bot.memory['games'][trigger.sender] = opendere.game.Game(trigger.sender, bot.nick, trigger.sender.lstrip('#'), command_prefix)
-        else:
-            # bot.say(trigger.sender, f"you can only start a game from {' or '.join(bot.memory['opendere_channels'])}")
-            return
-
-    # an action that occurs in a channel, e.g. 'vote'
-    if trigger.sender in bot.memory['games']:
-        messages = bot.memory['games'][trigger.sender].user_action(trigger.hostmask, trigger.match.string, trigger.sender)
-
-    # an action that occurs in a privmsg or notice[?], e.g. 'kill' or 'check'
-    # TODO: this probably breaks down if a user is somehow in multiple games, so we need to prevent that later...
-    elif trigger.hostmask in [user.uid for game in bot.memory['games'].values() for user in game.users.values()]:
-        game = next((game.channel for game in bot.memory['games'].values() for user in game.users.values() if user.uid == trigger.hostmask), None)
-        if not game:
-            return
-        messages = bot.memory['games'][game].user_action(trigger.hostmask, trigger.match.string)
-
-    if not messages:
-        return
-
-    for recipient, text in messages:
-        if recipient in bot.memory['opendere_channels']:
-            bot.say(bold(text), recipient)
-        else:
-            bot.notice(text, recipient.split('!')[0])
+    server = bot.memory['opendere_server']
+    channel = trigger.sender if trigger.sender != trigger.nick else None
+    submit(server, server.message, trigger.hostmask, trigger.nick, trigger.match.string, channel, trigger.admin)
+
+# commands sent privately don't need the prefix, as the games' help tells players, so those get a rule of their own
+@rule(opendere.router.Router(command_prefix, [channel.lstrip('#') for channel in opendere_channels]).private_pattern)
+@require_privmsg
+@thread(False)
+def relay_private(bot, trigger):
+    """
+    hand unprefixed private commands to the game server, see relay
+    """
+    relay(bot, trigger)
 
-    # if the game has ended or been reset
-    if bot.memory['games'][trigger.sender].channel is None:
-        del bot.memory['games'][trigger.sender]
+@event('NICK')
+@thread(False)
+def nick(bot, trigger):
+    """
+    follow players who change nick, so they don't drop out of their game
+    """
+    # for NICK, trigger.hostmask still has the old nick and the trigger itself is the new one
+    server = bot.memory['opendere_server']
+    new_nick = str(trigger)
+    submit(server, server.nick_change, trigger.hostmask, f"{new_nick}!{trigger.user}@{trigger.host}", new_nick)
+
+@event('QUIT', 'PART')
+@thread(False)
+def part(bot, trigger):
+    """
+    note players whose connection went away, so they can pick their seat back up from a new nick or host, and nobody
+    else can while they're still around
+    """
+    # netsplits and ping timeouts come through as QUITs too
+    if trigger.event == 'PART' and trigger.sender not in opendere_channels:
+        return
+    server = bot.memory['opendere_server']
+    submit(server, server.quit, trigger.hostmask)
@@ -4,9 +4,16 @@ from opendere import action
 
 
 class Ability:
+    """
+    abilities are shared by every instance of the role they belong to, so they hold no per-player state.
+    uses left are kept on the Role instance instead
+    """
+    __slots__ = ('num_uses', 'phases', 'command_public')
     name = None  # one-word name of the ability
+    aliases = ()  # other commands that do the same thing
     action_description = None  # brief description of the ability
     command = None  # command user runs to create the Action
+    action = None  # the Action type the ability creates, None for abilities that don't do anything yet
 
     # some actions, such as Guard and Hide, cannot *LOGICALLY* be done as non-phase operations
     # this isn't for replicating yandere logic, it's for ensuring actions like "hide"
@@ -14,22 +21,28 @@ class Ability:
     # is update game.phase_actions
     is_exclusively_phase_action = None
 
-    def __init__(self, num_uses=0, phases=[], command_public=False):
+    def __init__(self, num_uses=0, phases=(), command_public=False):
         """
         num_ability_uses (int): the number of times the ability can be used per game, usually either 0, 1 or infinity
         phases (List[Phase]): when the ability can be used. day, night or both
         command_public (boolean): determines whether the action is executed through private message or in the channel
         """
         self.num_uses = num_uses
-        self.phases = phases
+        self.phases = tuple(phases)
         self.command_public = command_public
 
     def __call__(self, apply_immediately, game, user, target_user=None):
+        """
+        apply or queue the ability's action, spending one of the user's uses unless it's already queued
+        """
         action_obj = self.action(game, user, target_user)
         if apply_immediately:
-            action_obj()
-        else:
-            game.phase_actions.append(action_obj)
+            user.role.use(self)
+            return action_obj()
+        if not game.phase_actions.append(action_obj):
+            return [(user.uid, f"you're already doing that this {game.phase_name}.")]
+        user.role.use(self)
+        return []
 
     @property
     def description(self):
@@ -42,6 +55,7 @@ class Ability:
 
 
 class UpgradeAbility(Ability):
+    __slots__ = ()
     name = 'upgrade'
     action_description = 'upgrade any other player'
     command = 'upgrade <user>'
@@ -50,6 +64,7 @@ class UpgradeAbility(Ability):
 
 
 class HideAbility(Ability):
+    __slots__ = ()
     name = 'hide'
     action_description = 'hide from killers'
     command = 'hide'
@@ -58,6 +73,7 @@ class HideAbility(Ability):
 
 
 class RevealAbility(Ability):
+    __slots__ = ()
     name = 'reveal'
     action_description = 'reveal to all other players'
     command = 'reveal'
@@ -66,6 +82,7 @@ class RevealAbility(Ability):
 
 
 class SpyAbility(Ability):
+    __slots__ = ()
     name = 'spy'
     action_description = 'inspect another player\'s role (be careful of disguised roles which may appear as other roles!)'
     command = 'spy <user>'
@@ -74,6 +91,7 @@ class SpyAbility(Ability):
 
 
 class StalkAbility(Ability):
+    __slots__ = ()
     name = 'stalk'
     action_description = 'learn where another player goes'
     command = 'stalk <user>'
@@ -82,6 +100,7 @@ class StalkAbility(Ability):
 
 
 class CheckAbility(Ability):
+    __slots__ = ()
     name = 'check'
     action_description = 'inspect another player\'s alignment'
     command = 'check <user>'
@@ -90,6 +109,7 @@ class CheckAbility(Ability):
 
 
 class GuardAbility(Ability):
+    __slots__ = ()
     name = 'guard'
     action_description = 'protect a player from any danger'
     command = 'guard <user>'
@@ -98,6 +118,7 @@ class GuardAbility(Ability):
 
 
 class KillAbility(Ability):
+    __slots__ = ()
     name = 'kill'
     action_description = 'single-handedly kill a player of their choosing'
     command = 'kill <user>'
@@ -111,57 +132,41 @@ class VoteKillAbility(Ability):
     your cohort consists of your unique (command_public, phase) combination,
     that means public-command day voters vote together (typical lynching)
     """
+    __slots__ = ()
     name = 'vote'
+    aliases = ('v', 'lynch')
     action_description = 'vote with others to kill'
     command = 'vote <user>'
     is_exclusively_phase_action = True
     action = action.VoteToKillAction
 
-    """
-    # TODO: this should be moved to VoteKillAction and other handlers
-    # NOTE: I think Ability.name should be changed to ability.commands = {command_name: num_params}
-
-    def __call__(self, game, user, target):
-
-        messages = list()
+    def __call__(self, apply_immediately, game, user, target_user=None):
+        """
+        target_user can also be 'a'/'abstain' or 'u'/'undecided'
+        """
         # TODO: night-time voting messages should go to all yanderes who can kill, not just the voter
-        reply_to = game.channel if game.phase == 'day' else user.uid
-
-        if target in ['u', 'unvote', 'undecide', 'undecided']:
-            if user not in game.votes:
-                messages.append((reply_to, f"{user.nick}: you're already undecided. {game.list_votes}"))
-            else:
-                prev = game.votes.pop(user)
-                messages.append((reply_to, f"{user.nick} has changed their vote from {prev.nick if prev is not None else 'abstain'} to undecided. {game.list_votes}"))
-
-        elif target in ['a', 'abstain']:
-            if user not in game.votes:
-                game.votes[user] = None
-                messages.append((reply_to, f"{user.nick} has voted to abstain. {game.list_votes}"))
-            elif game.votes[user] is None:
-                messages.append((reply_to, f"{user.nick}: you're already abstaining. {game.list_votes}"))
-            elif game.votes[user] is not None:
-                prev, game.votes[user] = game.votes.pop(user), None
-                messages.append((reply_to, f"{user.nick} has changed their vote from {prev.nick} to abstain. {game.list_votes}"))
-
-        elif target is not None and user != target:
-            if user not in game.votes:
-                game.votes[user] = target
-                messages.append((reply_to, f"{user.nick} has voted for {target.nick}. {game.list_votes}"))
-            elif game.votes[user] == target:
-                messages.append((reply_to, f"{user.nick}: you're already voting for {target.nick}. {game.list_votes}"))
-            elif game.votes[user] != target:
-                prev, game.votes[user] = game.votes.pop(user), target
-                messages.append((reply_to, f"{user.nick} has changed their vote from {prev.nick if prev is not None else 'abstain'} to {target.nick}. {game.list_votes}"))
-
+        reply_to = game.channel if self.command_public else user.uid
+        ballot = game.ballot(self.command_public, game.current_phase)
+        if user not in ballot:
+            prev = 'undecided'
         else:
-            # should only ever get here if one votes for themselves
-            messages.append((reply_to, f"you can't vote for {target.nick if user != target else 'yourself. sorry :('}. {game.list_votes}"))
-
-        # if everyone has voted, we can change the phase after this
-        # these numbers can be increased to give people some grace time to change their votes, or for dramatic effect...
-        if game.phase_name == 'day' and len(game.votes) == game.num_players_alive:
-            game.phase_end = datetime.now() + timedelta(seconds=random.randint(3))
-
-        return messages
-    """
+            prev = ballot[user].nick if ballot[user] is not None else 'abstain'
+
+        if target_user in ['u', 'undecided', 'unvote']:
+            if user not in ballot:
+                return [(reply_to, f"{user.nick}: you're already undecided. {game.list_votes}")]
+            ballot.unvote(user)
+            return [(reply_to, f"{user.nick} has changed their vote from {prev} to undecided. {game.list_votes}")]
+
+        if target_user in ['a', 'abstain']:
+            target_user = None
+        if target_user is user:
+            return [(reply_to, f"you can't vote for yourself. sorry :( {game.list_votes}")]
+        if user in ballot and ballot[user] is target_user:
+            return [(reply_to, f"{user.nick}: you're already {'voting for ' + target_user.nick if target_user else 'abstaining'}. {game.list_votes}")]
+
+        game.phase_actions.append(self.action(game, user, target_user, ballot))
+        user.role.use(self)
+        if prev == 'undecided':
+            return [(reply_to, f"{user.nick} has voted {'for ' + target_user.nick if target_user else 'to abstain'}. {game.list_votes}")]
+        return [(reply_to, f"{user.nick} has changed their vote from {prev} to {target_user.nick if target_user else 'abstain'}. {game.list_votes}")]
@@ -1,23 +1,50 @@
+import functools
+import weakref
 from collections import defaultdict
 
 
 """
 Pattern:
 - Actions are *applied* by users. When applied they are pushed to the Game.phase_actions queue.
-- Game.phase_actions is a list of Actions ordered by time of entry.
+- Game.phase_actions is an ActionQueue of Actions ordered by action_priority, then time of entry.
 - An action mutates the game state. A special case of game state mutation is updating Game.phase_actions itself. Some Actions
   delete other Actions from Game.phase_actions, for example a HideAction deletes a KillAction directed at the user. Some
   actions add "post-processing" actions to Game.phase_actions. For example, GuardAction will ensure if you're guarding
   yandere UnstoppableKillAction exists, and in turn UnstoppableKillAction will kill you once it's applied.
-- When adding to Game.phase_changes, it should be checked whether the Action already exists:`action in Game.phase_changes`
+- An Action is identified by its (type, user, target, phase), so two guards of the same player by the same player in
+  the same phase are the same Action. ActionQueue.append drops an Action that's already queued and returns whether it
+  was added, so there's no need to check `action in Game.phase_actions` first, though that's cheap too
 """
 
 
 class Action:
+    # actions only weakly reference their game, the game's queue is what keeps them alive
+    __slots__ = ('_game', 'user', 'target_user', 'phase')
+
     def __init__(self, game, user, target_user):
-        self.game = game
+        self._game = weakref.ref(game)
         self.user = user
         self.target_user = target_user
+        self.phase = game.phase
+
+    @property
+    def game(self):
+        return self._game()
+
+    @property
+    def key(self):
+        return type(self), self.user, self.target_user, self.phase
+
+    def __eq__(self, other):
+        if not isinstance(other, Action):
+            return NotImplemented
+        return self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.user and self.user.nick}, {self.target_user and self.target_user.nick}, phase={self.phase})"
 
     def __call__(self):
         # apply the Action. Actions either update game state by changing the
@@ -27,19 +54,15 @@ class Action:
 
     @property
     def actions_of_my_type(self):
-        return [
-            action for action in self.game.phase_actions
-            if isinstance(action, type(self))
-        ] + [self]
+        return self.game.phase_actions.of_type(type(self)) + [self]
 
     def del_actions_of_type(self, action_type):
-        self.game.phase_actions = [
-            action for action in self.game.phase_actions
-            if not isinstance(action, action_type)
-        ]
+        self.game.phase_actions.remove_type(action_type)
 
 
 class KillAction(Action):
+    __slots__ = ()
+
     def __call__(self):
         # kill the target
         self.target_user.is_alive = False
@@ -47,40 +70,46 @@ class KillAction(Action):
 
 
 class VoteToKillAction(Action):
+    __slots__ = ('ballot',)
+
+    def __init__(self, game, user, target_user, ballot=None):
+        # the vote counts as soon as it's cast, so the ballot always knows who's leading.
+        # a target_user of None is a vote to abstain
+        super().__init__(game, user, target_user)
+        self.ballot = game.votes if ballot is None else ballot
+        self.ballot.vote(user, target_user)
+
     def __call__(self):
-        # at the end of the phase, the first VoteToKillAction handles this logic for all
-        # instances of this action then deletes all instances of VoteToKillAction
-        vote_counts = defaultdict(int)
-        for action in self.actions_of_my_type:
-            vote_counts[action.target_user] += 1
-        most_voted_user = max(vote_counts, key=vote_counts.get)
-        # TODO: need logic to handle case whether there is a tie for most-voted
-
-        # TODO: "abstain" is bad, it should probably be a constant
-        if most_voted_user == "abstain":
-            return []  # TODO: message something about failing to lynch
-        else:
-            self.game.phase_actions.append(
-                KillAction(self.game, None, most_voted_user)
-            )
-            return []  # TODO: some message about who was voted to be lynched
+        # at the end of the phase, the first VoteToKillAction of a ballot reads its result for all
+        # instances of this action then deletes all of them
+        most_voted_user = self.ballot.tally()
 
         # ensure VoteToKillAction isn't processed twice
-        self.del_actions_of_type(type(self))
+        for action in self.game.phase_actions.of_type(type(self)):
+            if action.ballot is self.ballot:
+                self.game.phase_actions.remove(action)
+
+        if most_voted_user is None:
+            return []  # TODO: message something about failing to lynch
+        self.game.phase_actions.append(
+            KillAction(self.game, None, most_voted_user)
+        )
+        return []  # TODO: some message about who was voted to be lynched
 
 
 class UnstoppableKillAction(Action):
+    __slots__ = ()
+
     # A kill that shouldn't be eliminated from the action list
     __call__ = KillAction.__call__
 
 
 class GuardAction(Action):
+    __slots__ = ()
+
     def __call__(self):
         # eliminate any actions that kill self.target_user
-        self.game.phase_actions = [
-            action for action in self.game.phase_actions
-            if not (isinstance(action, KillAction) and action.target_user == self.target_user)
-        ]
+        self.game.phase_actions.remove_targeting(KillAction, self.target_user)
         # kill self if the guarded role isn't safe to guard
         if not self.target_user.role.safe_to_guard:
             self.game.phase_actions.append(
@@ -90,13 +119,12 @@ class GuardAction(Action):
 
 
 class HideAction(Action):
+    __slots__ = ()
     is_legal_during_day = False
+
     def __call__(self):
         # eliminate any actions that kill self.user
-        self.game.phase_actions = [
-            action for action in self.game.phase_actions
-            if not (isinstance(action, KillAction) and action.target_user == self.user)
-        ]
+        self.game.phase_actions.remove_targeting(KillAction, self.user)
         return []
 
 
@@ -108,3 +136,112 @@ action_priority = [
     KillAction,
     UnstoppableKillAction,
 ]
+
+
+class ActionQueue:
+    """
+    the Game.phase_actions queue, kept as one insertion-ordered bucket per action_priority type plus an index of
+    (action type, target) -> actions, so popping the next action, cancelling the kills on a target or dropping every
+    action of a type only touches the matching entries instead of rebuilding the whole list
+    iterating the queue yields actions in the order they'll be applied
+    """
+    def __init__(self, actions=()):
+        # dicts are used as insertion-ordered sets, keyed by the actions' (type, user, target, phase) identity
+        self._buckets = {action_type: {} for action_type in action_priority}
+        self._by_target = defaultdict(dict)
+        self._len = 0
+        for action in actions:
+            self.append(action)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for bucket in self._buckets.values():
+            yield from list(bucket)
+
+    def __contains__(self, action):
+        bucket = self._buckets.get(type(action))
+        return bucket is not None and action in bucket
+
+    def __eq__(self, other):
+        if isinstance(other, (ActionQueue, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self)!r})"
+
+    def append(self, action):
+        """
+        queue action unless an equal one is already queued. returns whether it was added
+        """
+        try:
+            bucket = self._buckets[type(action)]
+        except KeyError:
+            raise ValueError(f"{type(action).__name__} has no place in action_priority") from None
+        if action in bucket:
+            return False
+        bucket[action] = None
+        self._by_target[type(action), action.target_user][action] = None
+        self._len += 1
+        return True
+
+    def popleft(self):
+        """
+        remove and return the next action to apply, by (action_priority, time of entry)
+        """
+        for bucket in self._buckets.values():
+            if bucket:
+                action = next(iter(bucket))
+                self._discard(action)
+                return action
+        raise IndexError('pop from an empty ActionQueue')
+
+    def of_type(self, action_type):
+        """
+        every queued action that's an instance of action_type, in time of entry order per type
+        """
+        return [action for t in self._types(action_type) for action in self._buckets[t]]
+
+    def targeting(self, action_type, target_user):
+        return [action for t in self._types(action_type) for action in self._by_target.get((t, target_user), ())]
+
+    def is_targeted(self, action_type, target_user):
+        """
+        whether any queued action_type targets target_user, e.g. is_targeted(GuardAction, user) for whether they're guarded
+        """
+        return any((t, target_user) in self._by_target for t in self._types(action_type))
+
+    def remove(self, action):
+        self._discard(action)
+
+    def remove_type(self, action_type):
+        for t in self._types(action_type):
+            for action in list(self._buckets[t]):
+                self._discard(action)
+
+    def remove_targeting(self, action_type, target_user):
+        for action in self.targeting(action_type, target_user):
+            self._discard(action)
+
+    def clear(self):
+        self.__init__()
+
+    @staticmethod
+    def _types(action_type):
+        return _subtypes(action_type)
+
+    def _discard(self, action):
+        del self._buckets[type(action)][action]
+        key = type(action), action.target_user
+        del self._by_target[key][action]
+        if not self._by_target[key]:
+            del self._by_target[key]
+        self._len -= 1
+
+
+@functools.lru_cache(maxsize=None)
+def _subtypes(action_type):
+    # the action_priority types that are subclasses of action_type, worked out once per type
+    return tuple(t for t in action_priority if issubclass(t, action_type))
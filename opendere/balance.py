@@ -0,0 +1,224 @@
+"""
+exact win probabilities for role compositions, no monte carlo
+
+the game is modelled as a markov chain over who's left alive, for players who know nothing: every day someone
+random is lynched, and every night the yanderes kill a random non-yandere. roles that only help by knowing things
+can't change those odds, so the chain only keeps track of the ones that can without knowing anything:
+- hiders hide every night, so a yandere kill on them does nothing
+- guards each guard someone random besides themselves every night, which stops the yandere kill on them, but a
+  guard who picks a yandere that isn't safe_to_guard dies
+roles that can only hide or guard once count as plain. spent blind on some night, the one use saves someone with a
+chance of about one in the number of players, and keeping them apart would multiply the compositions to evaluate
+by about 45. the game ends as in Game.winner, and simulate.py plays the real engine if you want to check
+
+a state is (night, safe yanderes, unsafe yanderes, plain, hiders, guards) alive, see good_wins. a composition is the
+same counts at the start of the game, so every composition of every lobby size shares the states it leads to and
+all of them for 4-30 players take a few seconds. results are cached to disk as json
+
+    python -m opendere.balance --players 4-30 --cache balance.json
+"""
+import argparse
+import functools
+import json
+import math
+import os
+import time
+from collections import defaultdict
+
+from opendere import ability, game
+
+
+VERSION = 2
+
+SAFE_YANDERE, UNSAFE_YANDERE, PLAIN, HIDER, GUARD = range(5)
+CATEGORIES = ['safe yandere', 'unsafe yandere', 'plain', 'hider', 'guard']
+
+
+def category(role_class):
+    """
+    which of CATEGORIES a role class counts towards
+    """
+    if role_class.is_yandere:
+        return SAFE_YANDERE if role_class.safe_to_guard else UNSAFE_YANDERE
+    for ab in role_class.abilities:
+        if ab.num_uses == math.inf and isinstance(ab, ability.HideAbility):
+            return HIDER
+        if ab.num_uses == math.inf and isinstance(ab, ability.GuardAbility):
+            return GUARD
+    return PLAIN
+
+
+def category_odds(weights):
+    """
+    weights (Dict[Type[Role], float]): a role table from game.py
+    returns the chance of a draw from that table landing in each category
+    """
+    total = sum(weights.values())
+    odds = [0.0] * len(CATEGORIES)
+    for role_class, weight in weights.items():
+        odds[category(role_class)] += weight / total
+    return odds
+
+
+yandere_odds = category_odds(game.unweighted_yanderes)
+good_and_neutral_odds = category_odds({**game.weighted_good_role_classes, **game.weighted_neutral_role_classes})
+
+
+@functools.lru_cache(maxsize=None)
+def _guard_outcomes(guards, alive, unsafe):
+    """
+    for a night with this many guards, each guarding someone random out of the alive - 1 others, returns for each
+    number of guards that die guarding an unsafe yandere, (that chance, the chance of it and nobody guarding a given
+    non-guard player)
+    """
+    q = unsafe / (alive - 1)
+    r = 1 / (alive - 1)
+    return [
+        (math.comb(guards, k) * q ** k * (1 - q) ** (guards - k), math.comb(guards, k) * q ** k * (1 - r - q) ** (guards - k))
+        for k in range(guards + 1)
+    ]
+
+
+def _night(safe, unsafe, plain, hiders, guards):
+    """
+    {(plain, guards) left after the night: its chance}. nobody else can die at night
+    """
+    alive = safe + unsafe + plain + hiders + guards
+    targets = plain + hiders + guards
+    q = unsafe / (alive - 1)
+    outcomes = defaultdict(float)
+    # a hider was picked, so only guards can die
+    if hiders:
+        for k, (p, _) in enumerate(_guard_outcomes(guards, alive, unsafe)):
+            outcomes[plain, guards - k] += hiders / targets * p
+    # a plain player was picked, and dies unless someone guarded them
+    if plain:
+        for k, (p, unguarded) in enumerate(_guard_outcomes(guards, alive, unsafe)):
+            outcomes[plain - 1, guards - k] += plain / targets * unguarded
+            outcomes[plain, guards - k] += plain / targets * (p - unguarded)
+    # a guard was picked. they can't guard themselves, and can die guarding a yandere as well as from the kill
+    if guards:
+        for k, (p, unguarded) in enumerate(_guard_outcomes(guards - 1, alive, unsafe)):
+            guarded = p - unguarded
+            outcomes[plain, guards - 1 - k] += guards / targets * (unguarded + guarded * q)
+            outcomes[plain, guards - k] += guards / targets * guarded * (1 - q)
+    return outcomes
+
+
+@functools.lru_cache(maxsize=None)
+def good_wins(night, safe, unsafe, plain, hiders, guards):
+    """
+    night (bool): whether the next phase is a night
+    safe, unsafe, plain, hiders, guards (int): how many are alive in each category, see CATEGORIES
+    returns the chance good wins from here
+    """
+    yanderes = safe + unsafe
+    alive = yanderes + plain + hiders + guards
+    if not yanderes:
+        return 1.0
+    if yanderes * 2 >= alive:
+        return 0.0
+    if night:
+        return sum(p * good_wins(False, safe, unsafe, plain_after, hiders, guards_after) for (plain_after, guards_after), p in _night(safe, unsafe, plain, hiders, guards).items())
+    # day: someone random is lynched
+    state = [safe, unsafe, plain, hiders, guards]
+    chance = 0.0
+    for i, count in enumerate(state):
+        if count:
+            state[i] -= 1
+            chance += count / alive * good_wins(True, *state)
+            state[i] += 1
+    return chance
+
+
+def compositions(num_players):
+    """
+    every (composition, chance of Game._select_role_classes dealing it) for a lobby of num_players
+    """
+    num_yanderes = game.Game.num_yanderes(num_players)
+    for yandere_split, yandere_chance in _splits(num_yanderes, yandere_odds):
+        for split, chance in _splits(num_players - num_yanderes, good_and_neutral_odds):
+            yield tuple(a + b for a, b in zip(yandere_split, split)), yandere_chance * chance
+
+
+def _splits(n, odds):
+    """
+    every way to draw n roles into the categories with nonzero odds, and its multinomial chance
+    """
+    used = [i for i, p in enumerate(odds) if p]
+
+    def split(i, left):
+        if i == len(used) - 1:
+            yield {used[i]: left}
+            return
+        for k in range(left + 1):
+            for rest in split(i + 1, left - k):
+                yield {used[i]: k, **rest}
+
+    for counts in split(0, n):
+        chance = math.factorial(n)
+        for i, k in counts.items():
+            chance *= odds[i] ** k / math.factorial(k)
+        yield tuple(counts.get(i, 0) for i in range(len(CATEGORIES))), chance
+
+
+def evaluate(num_players):
+    """
+    the chance good wins in a lobby of num_players overall, and for each composition as rows of
+    [*counts, chance of being dealt it, chance good wins]
+    """
+    night = bool(num_players % 2)  # the first phase, see Game.phase_name
+    rows = []
+    overall = 0.0
+    for composition, chance in compositions(num_players):
+        good = good_wins(night, *composition)
+        overall += chance * good
+        rows.append([*composition, chance, good])
+    return {'players': num_players, 'yanderes': game.Game.num_yanderes(num_players), 'good': overall, 'evil': 1 - overall, 'compositions': rows}
+
+
+def _key():
+    # cached results are only good for the model and role tables they were worked out with
+    return [VERSION, CATEGORIES, yandere_odds, good_and_neutral_odds]
+
+
+def table(min_players=4, max_players=30, cache=None):
+    """
+    evaluate every lobby size from min_players to max_players, reading and writing results at the cache path if given
+    returns {num_players: evaluate(num_players)}
+    """
+    results = {}
+    if cache and os.path.exists(cache):
+        with open(cache) as f:
+            cached = json.load(f)
+        if cached.get('key') == json.loads(json.dumps(_key())):
+            results = {int(n): lobby for n, lobby in cached['lobbies'].items()}
+
+    missing = [n for n in range(min_players, max_players + 1) if n not in results]
+    for n in missing:
+        results[n] = evaluate(n)
+    if cache and missing:
+        with open(cache + '.tmp', 'w') as f:
+            json.dump({'key': _key(), 'lobbies': results}, f, separators=(',', ':'))
+        os.replace(cache + '.tmp', cache)
+    return {n: results[n] for n in range(min_players, max_players + 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--players', default='4-30', help='lobby size, or an inclusive range of them, e.g. 4-30')
+    parser.add_argument('--cache', help='json file to keep results in between runs')
+    args = parser.parse_args(argv)
+
+    min_players, _, max_players = args.players.partition('-')
+    started = time.perf_counter()
+    lobbies = table(int(min_players), int(max_players or min_players), args.cache)
+    print(json.dumps({
+        'seconds': round(time.perf_counter() - started, 3),
+        'compositions': sum(len(lobby['compositions']) for lobby in lobbies.values()),
+        'by_players': {n: {k: lobby[k] for k in ['yanderes', 'good', 'evil']} for n, lobby in lobbies.items()},
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+where games get the time from
+
+times are plain float seconds from a monotonic source, so setting the system clock or an ntp step never moves a
+phase deadline. Game reads its clock once per command or phase change, see Game.now, and tests and simulations swap
+in a VirtualClock to skip ahead instead of waiting
+"""
+import time
+
+
+class MonotonicClock:
+    """
+    seconds since some arbitrary point, from time.monotonic()
+    """
+    def now(self) -> float:
+        return time.monotonic()
+
+
+class VirtualClock:
+    """
+    a clock that only moves when it's told to
+    """
+    def __init__(self, start=0.0):
+        self.t = start
+
+    def now(self) -> float:
+        return self.t
+
+    def advance(self, seconds):
+        self.t += seconds
+
+    def advance_to(self, t):
+        """
+        jump to t, e.g. a game's phase_end. never goes backwards
+        """
+        self.t = max(self.t, t)
+
+
+default = MonotonicClock()
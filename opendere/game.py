@@ -1,20 +1,57 @@
-from datetime import datetime, timedelta
-from numpy import random
-from opendere import roles, action
+import bisect
+import functools
+import time
+import weakref
+from collections import Counter
+from opendere import roles, action, clock, metrics, rng, router, sampler, vote
 
 
 class InsufficientPlayersError(ValueError):
     pass
 
 
-def weighted_choices(choice_weight_map, num_choices):
-    choices = list(choice_weight_map)
-    weight_sum = sum(choice_weight_map.values())
-    probabilities = [choice_weight_map[c] / weight_sum for c in choices]
-    return list(random.choice(choices, (num_choices,), p=probabilities))
+def weighted_choices(choice_weight_map, num_choices, rng=rng.default):
+    """
+    for one-off tables. tables that are drawn from over and over should get their own WeightedSampler instead
+    """
+    return sampler.WeightedSampler(choice_weight_map).sample_many(num_choices, rng)
+
+
+weighted_good_role_classes = {
+    roles.Hikikomori: 2, roles.Tokokyohi: 4,
+    roles.Shogun: 2, roles.Warrior: 4,
+    roles.Samurai: 2, roles.Ronin: 4,
+    roles.Shisho: 2, roles.Sensei: 4,
+    roles.Idol: 2, roles.Janitor: 4,
+    roles.Spy: 1, roles.DaySpy: 1, roles.Esper: 4,
+    roles.Stalker: 2, roles.Witness: 4,
+    roles.Detective: 2, roles.Snoop: 4,
+    roles.Guardian: 2, roles.Nurse: 4,
+    roles.Civilian: 6, roles.Tsundere: 6
+}
+weighted_neutral_role_classes = {r: 1 for r in roles.all_role_classes if r.default_alignment == roles.Alignment.neutral}
+unweighted_yanderes = {r: 1 for r in roles.all_role_classes if r.is_yandere}
+
+smilies = {
+    r':D': 30,
+    r':3': 10,
+    r'^_^': 10,
+    r'x_x': 10,
+    r'x.x': 10,
+    r';_;': 10,
+    r'(╯°□°）╯︵ ┻━━┻': 5,
+    r'┻━┻︵ \(°□°)/ ︵ ┻━┻': 5
+}
+
+# the tables above never change, so their samplers are only built once
+good_and_neutral_role_sampler = sampler.WeightedSampler({**weighted_good_role_classes, **weighted_neutral_role_classes})
+yandere_role_sampler = sampler.WeightedSampler(unweighted_yanderes)
+smiley_sampler = sampler.WeightedSampler(smilies)
 
 
 class User:
+    __slots__ = ('_game', 'uid', 'nick', '_role', '_alignment', '_is_alive', 'is_hidden')
+
     def __init__(self, uid, nick):
         """
         uid (str): the player's user identifier, such as nick!user@host for irc or discord's user.id
@@ -23,77 +60,338 @@ class User:
         alignment (Alignment): the player's alignment, potentially changed from the default
         is_alive (bool): whether a player is dead or alive
         is_hidden (bool): whether a player is hiding from the mean and scary yanderes ;_;
+        game (Game): the game the player joined, which keeps count of who's alive as role, alignment and is_alive change.
+                     only weakly referenced, the game owns its players and not the other way around
         """
+        self._game = None
         self.uid = uid
         self.nick = nick
-        self.role = None
-        self.alignment = None
-        self.is_alive = True
+        self._role = None
+        self._alignment = None
+        self._is_alive = True
         self.is_hidden = False
 
+    @property
+    def game(self):
+        return None if self._game is None else self._game()
+
+    @game.setter
+    def game(self, game):
+        self._game = None if game is None else weakref.ref(game)
+
+    def _update(self, attr, value):
+        game = self.game
+        if game is None:
+            setattr(self, attr, value)
+            return
+        game._count(self, -1)
+        setattr(self, attr, value)
+        game._count(self, 1)
+
+    @property
+    def role(self):
+        return self._role
+
+    @role.setter
+    def role(self, role):
+        self._update('_role', role)
+
+    @property
+    def alignment(self):
+        return self._alignment
+
+    @alignment.setter
+    def alignment(self, alignment):
+        self._update('_alignment', alignment)
+
+    @property
+    def is_alive(self):
+        return self._is_alive
+
+    @is_alive.setter
+    def is_alive(self, is_alive):
+        self._update('_is_alive', is_alive)
+
+
+class NickIndex:
+    """
+    casefolded nick -> the Users with it, plus every (casefolded nick, uid, User) kept sorted so every nick starting
+    with a prefix is one bisect away. nicks that only differ by case, e.g. two discord display names, are all kept
+    """
+    def __init__(self):
+        self._users = {}
+        self._keys = []
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, user):
+        key = user.nick.casefold()
+        users = self._users.setdefault(key, [])
+        if user not in users:
+            users.append(user)
+            bisect.insort(self._keys, (key, user.uid, user))
+
+    def remove(self, user):
+        key = user.nick.casefold()
+        users = self._users.get(key, [])
+        if user in users:
+            users.remove(user)
+            if not users:
+                del self._users[key]
+            # uids are unique, so the comparison never gets as far as the users
+            del self._keys[bisect.bisect_left(self._keys, (key, user.uid))]
+
+    def get(self, nick):
+        """
+        the user called nick, ignoring case unless that's what tells two of them apart, or None if it's ambiguous
+        """
+        users = self._users.get(nick.casefold(), ())
+        if len(users) == 1:
+            return users[0]
+        exact = [user for user in users if user.nick == nick]
+        return exact[0] if len(exact) == 1 else None
+
+    def startswith(self, prefix):
+        """
+        every user whose nick starts with prefix, in nick order
+        """
+        prefix = prefix.casefold()
+        # walk from the first match instead of slicing, which would copy the rest of the keys
+        for i in range(bisect.bisect_left(self._keys, (prefix,)), len(self._keys)):
+            key, _, user = self._keys[i]
+            if not key.startswith(prefix):
+                return
+            yield user
+
+    def page(self, start, size):
+        """
+        size users from the start-th one on, in nick order
+        """
+        return [user for _, _, user in self._keys[start:start + size]]
+
+
+def split_uid(uid):
+    """
+    an irc hostmask, nick!user@host, as (casefolded nick, user, host), or None for any other kind of uid, e.g. discord's
+    """
+    nick, bang, rest = uid.partition('!')
+    user, at, host = rest.partition('@')
+    if not (bang and at):
+        return None
+    return nick.casefold(), user, host
+
+
+class IdentityIndex:
+    """
+    uids by each two of the three parts of their hostmask, so a player who comes back with a new nick or from a new
+    host is still known by the other two, in three dict lookups. a pair several uids share, e.g. a web client's
+    user@host, doesn't match any of them. uids that aren't hostmasks aren't kept at all
+    """
+    def __init__(self):
+        self._uids = {}  # (which two parts, part, part) -> set of uids
+
+    def __len__(self):
+        return sum(len(uids) for uids in self._uids.values()) // 3
+
+    @staticmethod
+    def _pairs(uid):
+        parts = split_uid(uid)
+        if parts is None:
+            return ()
+        nick, user, host = parts
+        return (('nick!user', nick, user), ('nick@host', nick, host), ('user@host', user, host))
+
+    def add(self, uid):
+        for pair in self._pairs(uid):
+            self._uids.setdefault(pair, set()).add(uid)
+
+    def remove(self, uid):
+        for pair in self._pairs(uid):
+            uids = self._uids.get(pair)
+            if uids is not None:
+                uids.discard(uid)
+                if not uids:
+                    del self._uids[pair]
+
+    def match(self, uid):
+        """
+        uid if it's known, otherwise the one known uid sharing two parts with it, or None
+        """
+        matches = set()
+        for pair in self._pairs(uid):
+            uids = self._uids.get(pair, ())
+            if uid in uids:
+                return uid
+            if len(uids) == 1:
+                matches.update(uids)
+        return matches.pop() if len(matches) == 1 else None
+
+
+def event(method):
+    """
+    read the game's clock once for the whole of a command or phase change, so every time in its messages agrees
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._now is not None:
+            return method(self, *args, **kwargs)
+        self._now = self.clock.now()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._now = None
+    return wrapper
+
+
+def recorded(method):
+    """
+    run a phase change through the game's Recorder, if it has one, so it's captured when it's slow. see opendere.recorder
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.recorder is None:
+            return method(self, *args, **kwargs)
+        return self.recorder.watch(self, method.__name__, lambda: method(self, *args, **kwargs))
+    return wrapper
+
 
 class Game:
-    def __init__(self, channel, bot, name, prefix='!', allow_late=False):
+    # from this many players on, rosters and vote counts are summarised instead of listed in full
+    large_lobby = 30
+    roster_page_size = 40
+    top_votes = 5
+
+    def __init__(self, channel, bot, name, prefix='!', allow_late=False, scheduler=None, seed=None, rng_backend='stdlib', journal=None, metrics=metrics.default, clock=clock.default, recorder=None):
         """
         channel (str): the channel in which the game commands are to be sent
         bot (str): the name of the bot running the game
         name (str): the name of the current game, may want to move this elsewhere for themes
         prefix (str): the prefix used for game commands
         allow_late (bool): whether a player can join the game during the first phase
+        scheduler (Scheduler): optionally told about every change to phase_end, so the frontend doesn't have to poll tick()
+        seed (int): seeds the game's own random stream, picked at random if None. the same seed and commands replay the same game
+        rng_backend (str): 'stdlib', or 'numpy' for big batches of draws, see opendere.rng
+        journal (Journal): optionally records every command and phase change, so the game can be replayed, see opendere.journal
+        metrics (Registry): where phase timings are recorded, see opendere.metrics
+        clock (MonotonicClock): where the game gets the time from, e.g. a VirtualClock in tests, see opendere.clock
+        recorder (Recorder): optionally captures phase changes that go over its time budget, see opendere.recorder
         users (Dict[str, User]): players who've joined the game
+        alive (Dict[str, User]): players still alive, by uid
+        dead (Dict[str, User]): players no longer alive, by uid
+        alive_counts (Counter): living players per alignment, plus 'yanderes' and 'yandere killers'
+        nicks (NickIndex): living players by casefolded nick, for resolving command targets
+        identities (IdentityIndex): every player's uid by the parts of their hostmask, see _nick_change
         phase (int): current phase (1 day and 1 night is 2 phases)
-        phase_end (datetime.datetime): when the phase is scheduled to end. can be extended or hurried
+        phase_end (float): when the phase is scheduled to end, in clock seconds. can be extended or hurried
         hurries (List[User]): users who've requested the phase be hurried
-        votes (Dict[User, User]): users and who've they've voted to kill
-        phase_actions (List[Action]): actions queued to execute at the end of phase (e.g. hides, kills, checks)
+        ballots (Dict[Tuple[bool, Phase], VoteLedger]): the votes of each voting cohort this phase, see VoteKillAbility
+        phase_actions (ActionQueue): actions queued to execute at the end of phase (e.g. hides, kills, checks)
         """
         self.channel = channel
         self.bot = bot
         self.name = name
         self.prefix = prefix
         self.allow_late = allow_late
+        self.router = router.Router(prefix, [name] if name else [])
+        self.scheduler = scheduler
+        self.clock = clock
+        self._now = None
+        self.seed = rng.new_seed() if seed is None else seed
+        self.rng = rng.new(self.seed, rng_backend)
         self.users = {}
+        self.alive = {}
+        self.dead = {}
+        self.alive_counts = Counter()
+        self.nicks = NickIndex()
+        self.identities = IdentityIndex()
         self.phase = None
         self.phase_end = None
         self.hurries = []
-        # maybe should be moved to User for `[user.vote for user in self.users.values()]` instead
-        self.votes = {}  # probably can be eliminated and handled by the VoteKillAction
-        self.phase_actions = []
+        self.ballots = {}
+        self.phase_actions = action.ActionQueue()
+        self.journal = journal
+        self.metrics = metrics
+        self.recorder = recorder
+        self._record('game', channel, bot, name, prefix, allow_late, self.seed, self.rng.name)
 
-    @staticmethod
-    def _select_roles(num_users):
+    @property
+    def now(self) -> float:
         """
-        Select N roles for the players of the game
+        the time the current command or phase change started at, or the clock's time outside of one
         """
-        weighted_good_role_classes = {
-            roles.Hikikomori: 2, roles.Tokokyohi: 4,
-            roles.Shogun: 2, roles.Warrior: 4,
-            roles.Samurai: 2, roles.Ronin: 4,
-            roles.Shisho: 2, roles.Sensei: 4,
-            roles.Idol: 2, roles.Janitor: 4,
-            roles.Spy: 1, roles.DaySpy: 1, roles.Esper: 4,
-            roles.Stalker: 2, roles.Witness: 4,
-            roles.Detective: 2, roles.Snoop: 4,
-            roles.Guardian: 2, roles.Nurse: 4,
-            roles.Civilian: 6, roles.Tsundere: 6
-        }
-        weighted_neutral_role_classes = {r: 1 for r in roles.all_role_classes if r.default_alignment == roles.Alignment.neutral}
-        weighted_good_and_neutral_role_classes = {
-            **weighted_good_role_classes,
-            **weighted_neutral_role_classes
-        }
-
-        unweighted_yanderes = {r: 1 for r in roles.all_role_classes if r.is_yandere}
+        return self.clock.now() if self._now is None else self._now
 
+    def _record(self, kind, *args):
+        if self.journal is not None:
+            self.journal.record(kind, *args)
+
+    @property
+    def phase_end(self):
+        return self._phase_end
+
+    @phase_end.setter
+    def phase_end(self, deadline):
+        self._phase_end = deadline
+        if self.scheduler is None:
+            return
+        if deadline is None:
+            self.scheduler.cancel(self)
+        else:
+            self.scheduler.schedule(self, deadline)
+
+    @property
+    def phase_actions(self):
+        return self._phase_actions
+
+    @phase_actions.setter
+    def phase_actions(self, actions):
+        self._phase_actions = actions if isinstance(actions, action.ActionQueue) else action.ActionQueue(actions)
+
+    @classmethod
+    def num_yanderes(cls, num_users):
+        """
+        how many of num_users players are dealt a yandere role. balance.py works out what this does to the odds
+        """
         # possibly needs tweaking for balance:
         #  4-6  players: 1 yandere
         #  7-9  players: 2 yanderes
         # 10-12 players: 3 yanderes
-        num_yanderes = (num_users - 1) // 3
+        # and so on, one for every 3 players up to a large lobby. from there it's one more for every 6 players, since
+        # a third of a big lobby would win every game
+        if num_users < cls.large_lobby:
+            return (num_users - 1) // 3
+        return (cls.large_lobby - 1) // 3 + (num_users - cls.large_lobby) // 6
 
-        role_classes = weighted_choices(unweighted_yanderes, num_yanderes)
-        role_classes += weighted_choices(weighted_good_and_neutral_role_classes, num_users - num_yanderes)
-        return [role() for role in role_classes]
+    @classmethod
+    def _select_role_classes(cls, num_users, rng=rng.default):
+        """
+        Select N role classes for the players of the game
+        """
+        num_yanderes = cls.num_yanderes(num_users)
+        return yandere_role_sampler.sample_many(num_yanderes, rng) + good_and_neutral_role_sampler.sample_many(num_users - num_yanderes, rng)
+
+    @classmethod
+    def _select_roles(cls, num_users, rng=rng.default):
+        """
+        Select N roles for the players of the game
+        """
+        return [role(rng) for role in cls._select_role_classes(num_users, rng)]
+
+    @property
+    def is_large(self) -> bool:
+        return len(self.users) >= self.large_lobby
+
+    @property
+    def phase_length(self) -> int:
+        """
+        how many seconds the next phase lasts. big lobbies get longer, up to 15 minute days and 5 minute nights, since
+        more players take longer to talk things over and get their votes in
+        """
+        extra = max(self.num_players_alive - self.large_lobby, 0)
+        if self.phase_name == 'day':
+            return min(300 + 2 * extra, 900)
+        return min(120 + extra, 300)
 
     @property
     def phase_name(self) -> str:
@@ -108,17 +406,7 @@ class Game:
         a random smiley
         rarely an actual emoji but i'm not calling the function random_smiley unless someone tells me to change it or remove it
         """
-        smilies = {
-            r':D': 30,
-            r':3': 10,
-            r'^_^': 10,
-            r'x_x': 10,
-            r'x.x': 10,
-            r';_;': 10,
-            r'(╯°□°）╯︵ ┻━━┻': 5,
-            r'┻━┻︵ \(°□°)/ ︵ ┻━┻': 5
-        }
-        return weighted_choices(smilies, 1)[0]
+        return smiley_sampler.sample(self.rng)
 
     @property
     def day_num(self) -> int:
@@ -132,21 +420,63 @@ class Game:
         """
         number of players still alive
         """
-        return len([user for user in self.users.values() if user.is_alive])
+        return len(self.alive)
 
     @property
     def num_yanderes_alive(self) -> int:
         """
         number of yanderes still alive
         """
-        return len([user for user in self.users.values() if user.is_alive and user.role.is_yandere])
+        return self.alive_counts['yanderes']
 
     @property
     def num_yandere_killers(self) -> int:
         """
         number of yanderes who can kill, i.e. not traps
         """
-        return len([user for user in self.users.values() if user.is_alive and user.role.is_yandere for ability in user.role.abilities if ability.name == 'vote' for phase in ability.phases if phase.name == 'night'])
+        return self.alive_counts['yandere killers']
+
+    @property
+    def winner(self):
+        """
+        the Alignment that's won, i.e. good once every yandere is dead and evil once the yanderes can't be outvoted,
+        or None while the game's still going
+        """
+        if self.phase is None:
+            return None
+        elif not self.num_yanderes_alive:
+            return roles.Alignment.good
+        elif self.num_yanderes_alive * 2 >= self.num_players_alive:
+            return roles.Alignment.evil
+        return None
+
+    def _count(self, user, sign):
+        """
+        add (sign=1) or remove (sign=-1) a player to/from the alive and dead partitions and the counters.
+        User calls this around every change to its role, alignment or is_alive
+        """
+        if not user.is_alive:
+            if sign > 0:
+                self.dead[user.uid] = user
+            else:
+                del self.dead[user.uid]
+            return
+
+        if sign > 0:
+            self.alive[user.uid] = user
+            self.nicks.add(user)
+        else:
+            del self.alive[user.uid]
+            self.nicks.remove(user)
+
+        role = user.role
+        alignment = user.alignment if user.alignment is not None or role is None else role.default_alignment
+        if alignment is not None:
+            self.alive_counts[alignment] += sign
+        if role is not None and role.is_yandere:
+            self.alive_counts['yanderes'] += sign
+            if any(ability.name == 'vote' and roles.Phase.night in ability.phases for ability in role.abilities):
+                self.alive_counts['yandere killers'] += sign
 
     @property
     def time_left(self) -> float:
@@ -154,48 +484,104 @@ class Game:
         time left till the phase ends because why not
         """
         # rounded off to 1 decimal point for now, but should probably be completely removed later
-        return round((self.phase_end - datetime.now()).total_seconds(), 1)
+        return round(self.phase_end - self.now, 1)
+
+    @property
+    def current_phase(self):
+        """
+        the current phase as a roles.Phase, or None if the game hasn't started
+        """
+        return None if self.phase is None else roles.Phase[self.phase_name]
+
+    def ballot(self, command_public, phase):
+        """
+        the VoteLedger of the (command_public, phase) voting cohort, created on its first vote
+        """
+        cohort = (command_public, phase)
+        if cohort not in self.ballots:
+            self.ballots[cohort] = vote.VoteLedger(cohort, first_vote_breaks_ties=phase == roles.Phase.night)
+        return self.ballots[cohort]
+
+    @property
+    def votes(self) -> vote.VoteLedger:
+        """
+        the ballot of the phase's main cohort, i.e. public lynch votes during the day and private yandere votes at night
+        """
+        if self.phase_name == 'night':
+            return self.ballot(False, roles.Phase.night)
+        return self.ballot(True, roles.Phase.day)
 
     @property
     def list_votes(self) -> str:
         """
         a list of votes and count of each
         """
-        votes = "current votes are: "
-        for vote in {vote for vote in self.votes.values() if vote}:
-            votes += f"{vote.nick}: {[vote for vote in self.votes.values()].count(vote)}, "
-        votes += f"abstained: {list(self.votes.values()).count(None)}, "
-        votes += f"undecided: {(self.num_players_alive if self.phase_name == 'day' else self.num_yandere_killers) - len(self.votes)}"
+        ballot = self.votes
+        if self.is_large:
+            # only the leaders, so the reply stays short and doesn't grow with the lobby
+            top = ballot.top(self.top_votes)
+            votes = "top votes are: "
+            for target, count in top:
+                votes += f"{target.nick}: {count}, "
+            others = len(ballot.counts) - (None in ballot.counts) - len(top)
+            if others:
+                votes += f"{others} others, "
+        else:
+            votes = "current votes are: "
+            for target, count in ballot.counts.items():
+                if target is not None:
+                    votes += f"{target.nick}: {count}, "
+        votes += f"abstained: {ballot.abstained}, "
+        votes += f"undecided: {(self.num_players_alive if self.phase_name == 'day' else self.num_yandere_killers) - len(ballot)}"
         return votes
 
     def _nick_change(self, uid, new_uid, nick, new_nick):
         """
-        handle nickname changes
-        discord user.id will always stay the same, but nick or name can change so we should track those
-        irc hostmask nick!user@host can change, so we should split into a three tuple, and match on any two
+        move a player over to a new uid and nick, e.g. after an irc nick change or reconnecting from a new host.
+        discord user.ids never change but nicks can. votes and queued actions point at the User itself, so only the
+        users, alive or dead, nicks and identities keys move, plus the player's place in hurries
+        nick (str): the player's nick before the change
+        returns None if uid isn't playing, or new_uid already is
         """
-        # TODO: handle nickname changes. i still don't know what do about untypeable nicks on discord though
-        pass
-
+        user = self.users.get(uid)
+        if user is None or (new_uid != uid and new_uid in self.users):
+            return None
+        self._record('nick', uid, new_uid, nick, new_nick)
+
+        # out under the old keys...
+        self._count(user, -1)
+        del self.users[uid]
+        self.identities.remove(uid)
+        user.uid, user.nick = new_uid, new_nick
+        # ...and back in under the new ones
+        self.users[new_uid] = user
+        self.identities.add(new_uid)
+        self._count(user, 1)
+        if uid in self.hurries:
+            self.hurries[self.hurries.index(uid)] = new_uid
+        return []
+
+    @recorded
     def _process_phase_actions(self):
+        started = time.perf_counter()
+        self.metrics.observe('opendere_phase_actions_queued', len(self.phase_actions))
         messages = []
         while self.phase_actions:
-            # pop first item from list sorted by (action_priority, index in list)
-            top_priority_action_index = self.phase_actions.index(min(
-                self.phase_actions, key=lambda a: (
-                    action.action_priority.index(type(a)),  # actions type priority
-                    self.phase_actions.index(a)  # actions position priority
-                )
-            ))
-            curr_action = self.phase_actions.pop(top_priority_action_index)
+            # pop the first item by (action_priority, time of entry)
+            curr_action = self.phase_actions.popleft()
             messages.append(curr_action())  # apply action and add resulting messages
+        self.metrics.observe('opendere_process_phase_actions_seconds', time.perf_counter() - started)
         return messages
 
+    @event
+    @recorded
     def _phase_change(self):
         """
         handle events that happen during a phase change
         """
         #TODO: replace the current vote-counting code with a call to self._process_phase_actions()
+        started = time.perf_counter()
+        self._record('phase')
         messages = list()
         target = self.tally_votes()
 
@@ -203,8 +589,8 @@ class Game:
             if len(self.users) <= 3:
                 raise InsufficientPlayersError
 
-            roles = self._select_roles(len(self.users))
-            random.shuffle(roles)
+            roles = self._select_roles(len(self.users), self.rng)
+            self.rng.shuffle(roles)
             for i, user in enumerate(self.users.values()):
                 user.role = roles[i]
                 messages.append((user.uid, f"you're a {user.role.name}. {user.role.description}"))
@@ -214,7 +600,7 @@ class Game:
 
         # these numbers will probably need tweaking. i'm hoping for a much faster paced game than vanilla yandere
         # i've also changed how hurry/extend mechanics work, so keep that in mind as well
-        self.phase_end = datetime.now() + timedelta(seconds=(300 if self.phase_name == 'day' else 120))
+        self.phase_end = self.now + self.phase_length
 
         if (self.phase + len(self.users)) % 2:
             if self.phase <= 0:
@@ -254,7 +640,7 @@ class Game:
             elif not messages:
                 messages.append((self.channel, f"...it seems everyone survived the night. it is a brand new day :D"))
             else:
-                random.shuffle(messages)
+                self.rng.shuffle(messages)
                 messages.insert(0, (self.channel, f"morning comes with the stench of death."))
 
             messages.append((self.channel, "{} DAY {}. there {} {} {}. discuss who to accuse of being a yandere and viciously murder before they kill you first {}".format(
@@ -268,30 +654,59 @@ class Game:
 
         # set things up for the next phase
         self.hurries = list()
-        self.votes = dict()
-        self.phase_actions = list()
+        self.ballots = dict()
+        self.phase_actions.clear()
 
-        messages.append((self.channel, f"current players: {', '.join([user.nick for user in self.users.values()])}. {self.time_left} seconds left before, hopefully, one of them dies {self.random_emoji}"))
+        if self.is_large:
+            players = f"{self.num_players_alive} players are still alive ({len(self.dead)} dead), see {self.prefix}players for who"
+        else:
+            players = f"current players: {', '.join([user.nick for user in self.users.values()])}"
+        messages.append((self.channel, f"{players}. {self.time_left} seconds left before, hopefully, one of them dies {self.random_emoji}"))
 
+        if self.journal is not None:
+            self.journal.flush()
+        self.metrics.observe('opendere_phase_change_seconds', time.perf_counter() - started)
         return messages
 
-    def get_user(self, nick):
+    def get_user(self, nick, prefix=False):
         """
         return the User object by uid or nick if found and still alive
+        prefix (bool): also accept the start of a nick, as long as only one living player's nick starts with it
         """
         if nick in self.users and self.users[nick].is_alive:
             return self.users[nick]
-        return next((user for user in self.users.values() if nick.lower() == user.nick.lower() and user.is_alive), None)
-
+        user = self.nicks.get(nick)
+        if user is not None and user.is_alive:
+            return user
+        if not prefix:
+            return None
+        # stop looking as soon as the prefix turns out to be ambiguous
+        matches = []
+        for user in self.nicks.startswith(nick):
+            if user.is_alive:
+                matches.append(user)
+                if len(matches) > 1:
+                    return None
+        return matches[0] if matches else None
+
+    def _add_user(self, user):
+        self.users[user.uid] = user
+        self.identities.add(user.uid)
+        user.game = self
+        self._count(user, 1)
+        return user
+
+    @event
     def join_game(self, uid, nick):
         """
         uid (str): a unique user identifier, such as nick!user@host for irc, or discord's user.id
         nick (str): the player's nickname
         """
+        self._record('join', uid, nick)
         messages = list()
 
         if not self.users:
-            self.phase_end = datetime.now() + timedelta(seconds=60)
+            self.phase_end = self.now + 60
             messages.append((self.channel, f"an opendere game is starting in {self.channel} in {self.time_left} seconds! please type !opendere to join!"))
 
         if uid in self.users:
@@ -302,14 +717,14 @@ class Game:
 
         elif uid not in self.users:
             if self.phase is None:
-                self.users[uid] = User(uid, nick)
+                self._add_user(User(uid, nick))
                 messages.append((uid, f"you've joined the current game, which is starting in {self.time_left} seconds."))
 
             # allow a player to join the game late if it's the very first phase of the game
             elif self.allow_late and self.phase == 0:
-                self.users[uid] = User(uid, nick)
+                self._add_user(User(uid, nick))
                 # a 1 in 6 chance of being a yandere
-                self.users[uid].role = random.choice(self._select_roles(6))
+                self.users[uid].role = self.rng.choice(self._select_role_classes(6, self.rng))(self.rng)
                 messages.append((self.channel, f"suspicious slow-poke {nick} joined the game late."))
                 messages.append((uid, f"you've joined the current game with role {self.users[uid].role.name} - {self.users[uid].role.description}"))
 
@@ -317,45 +732,120 @@ class Game:
                 messages.append((uid, f"sorry, you can't join a game that's already in-progress. please wait for the next game."))
         return messages
 
+    @event
     def tick(self):
         if self.time_left <= 0:
             return self._phase_change()
 
+    @event
     def user_action(self, uid, action, channel=None):
         """
         determines whether a user has the ability to take an action, then executes the action
+        action (str): the line as the user said it, e.g. '!vote kitties'
+        channel (str): the channel it was said in, or None if it was said privately
         """
-        if self.phase is None or (channel and not action.startswith(self.prefix)):
+        route = self.router.parse(action, public=bool(channel))
+        if route is None:
             return
+        return self.user_command(uid, route, channel, action)
 
-        action = action.lstrip(self.prefix).lstrip('opendere').lstrip(self.name).split(maxsplit=1)
+    @event
+    def user_command(self, uid, route, channel=None, text=None):
+        """
+        user_action for a line that's already been parsed by a Router, see opendere.router
+        text (str): the line as the user said it, for the journal
+        """
+        if self.phase is None:
+            return
+        elif route.kind == router.PLAYERS:
+            return self.user_players(uid, int(route.args) if route.args.isdigit() else 1)
+        elif route.kind == router.UNVOTE:
+            route = router.Route(router.ABILITY, 'vote', route.command)
+        elif route.kind not in (router.ABILITY, router.HELP):
+            return
+        self._record('action', uid, text, channel)
+
+        # dead players and spectators can't do anything
+        user = self.alive.get(uid)
+        if user is None:
+            return
+        if route.kind == router.HELP:
+            return self.user_help(uid)
 
-        for ability in self.users[uid].role.abilities:
-            # maybe change ability.name to a list, so we can use that as a list of command aliases?
-            if action[0].lower() != ability.name or self.phase_name not in [phase.name for phase in ability.phases]:
+        command, args = route.command, route.args
+
+        ability = user.role.commands.get((command, self.current_phase))
+        if ability is None:
+            return
+        elif ability.action is None:
+            return [(uid, f"the {ability.name} ability isn't in the game yet, sorry {self.random_emoji}")]
+        elif channel and not ability.command_public:
+            return [(uid, f"please PM/notice {self.bot} with your commands instead.")]
+        elif ability.command_public and not channel:
+            return [(uid, f"please enter that command in {self.channel} instead.")]
+
+        if '<user>' not in ability.command:
+            target = None
+        elif not args:
+            return [(uid, f"usage: {ability.command}")]
+        elif args in ['a', 'u', 'abstain', 'undecided', 'unvote'] and ability.action is action.VoteToKillAction:
+            # only a vote can be for nobody, anything else needs a player to do it to
+            target = args
+        else:
+            target = self.get_user(args, prefix=True)
+            if target is None:
+                return [(uid, f"invalid target '{args}' for command {command}. please try again.")]
+        if not user.role.uses_left(ability):
+            return [(uid, f"you've already used up your {ability.name} ability.")]
+        # the ability spends the use itself, since re-issuing a queued action doesn't use it up again
+        return ability(False, self, user, target)
+
+    def user_players(self, uid, page=1):
+        """
+        one page of the living players, sent privately so big lobbies don't flood the channel
+        page (int): which page, starting from 1
+        """
+        pages = max(-(-self.num_players_alive // self.roster_page_size), 1)
+        page = min(max(page, 1), pages)
+        nicks = ', '.join(user.nick for user in self.nicks.page((page - 1) * self.roster_page_size, self.roster_page_size))
+        return [(uid, f"players alive ({page}/{pages}): {nicks or 'nobody'}")]
+
+    def user_help(self, uid):
+        """
+        what a player can do right now, read straight off their role's compiled table
+        """
+        user = self.alive.get(uid)
+        if user is None or self.phase is None:
+            return [(uid, "you can't do anything in the current game right now.")]
+        usable = []
+        for ability in user.role.abilities_by_phase[self.current_phase]:
+            if ability.action is None or not user.role.uses_left(ability):
                 continue
-            elif channel and not ability.command_public:
-                return [(uid, f"please PM/notice {self.bot} with your commands instead.")]
-            elif ability.command_public and not channel:
-                return [(uid, f"please enter that command in {self.channel} instead.")]
+            elif ability.command_public:
+                usable.append(f"{self.prefix}{ability.command} in {self.channel}")
             else:
-                if action[1] in ['a', 'u', 'abstain', 'undecided']:
-                    target = action[1]
-                else:
-                    target = self.get_user(action[1])
-                if target is None:
-                    return [(uid, f"invalid target '{action[1]}' for command {action[0]}. please try again.")]
-                return ability(self, self.get_user(uid), target)
+                usable.append(f"{ability.command} privately")
+        if not usable:
+            return [(uid, f"there's nothing you can do this {self.phase_name}, but wait {self.random_emoji}")]
+        return [(uid, f"this {self.phase_name} you can: {', '.join(usable)}")]
 
     def reset(self):
+        self._record('reset')
+        if self.journal is not None:
+            self.journal.flush()
+        self.phase_end = None
+        for user in self.users.values():
+            user.game = None
         self.__init__(channel=None, bot=None, name=None)
 
+    @event
     def user_extend(self, uid):
         """
         give people more time, or, secretly let people join the game late :D
         before the game starts, this increases the time to 60 seconds, or time_left + 30 seconds, whichever is _less, every time it's called
         during the game, this increases the time in the phase by a percentage, but will need to be adjusted to scale to the number of players
         """
+        self._record('extend', uid)
         messages = list()
         if uid not in self.users:
             messages.append((self.channel, f"you're not playing in the current game."))
@@ -369,12 +859,12 @@ class Game:
 
         if self.phase is None:
             if self.time_left < 30:
-                self.phase_end = datetime.now() + timedelta(seconds=(self.time_left + 30))
+                self.phase_end = self.now + self.time_left + 30
             else:
-                self.phase_end = datetime.now() + timedelta(seconds=60)
+                self.phase_end = self.now + 60
         else:
             self.hurries.append(uid)
-            self.phase_end = self.phase_end + timedelta(seconds=((self.phase_end - datetime.now()).total_seconds()//(5 if self.phase_name == 'day' else 10)))
+            self.phase_end = self.phase_end + (self.phase_end - self.now)//(5 if self.phase_name == 'day' else 10)
 
         messages.append((self.channel, "players have {} seconds before the {}".format(
             self.time_left,
@@ -382,6 +872,7 @@ class Game:
         )))
         return messages
 
+    @event
     def user_hurry(self, uid):
         """
         request that the game be hurried
@@ -389,6 +880,7 @@ class Game:
         during all other phases the time decreases by 10% for every player that calls it
         these numbers will need to be adjusted to scale to the number of players
         """
+        self._record('hurry', uid)
         messages = list()
 
         if uid not in self.users:
@@ -397,7 +889,7 @@ class Game:
         elif uid in self.hurries:
             messages.append((uid, f"you've already hurried or extended the phase already."))
 
-        self.phase_end = self.phase_end - timedelta(seconds=((self.phase_end - datetime.now()).total_seconds()//(5 if self.phase_name == 'day' else 10)))
+        self.phase_end = self.phase_end - (self.phase_end - self.now)//(5 if self.phase_name == 'day' else 10)
         self.hurries.append(uid)
         messages.append((self.channel, f"tick-tock! players have {self.time_left} seconds before the {self.phase_name} ends!"))
 
@@ -405,21 +897,4 @@ class Game:
 
     def tally_votes(self):
         # TODO: probably can be moved to VoteKillAction
-        counts = sorted({vote: list(self.votes.values()).count(vote) for vote in set(self.votes.values())}.items(), key=lambda x: x[1], reverse=True)
-        # no one voted
-        if not counts:
-            return None
-        # only one person was voted for
-        elif len(counts) == 1:
-            return counts[0][0]
-        # one person has the most votes
-        elif counts[0][1] > counts[1][1]:
-            return counts[0][0]
-        # otherwise, at night, the first yandere to vote for someone (i.e. not abstain) wins
-        elif self.phase_name == 'night':
-            for target in iter(self.votes.values()):
-                if target is not None:
-                    return target
-            return None
-        # otherwise, everyone survives
-        return None
+        return self.votes.tally()
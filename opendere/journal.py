@@ -0,0 +1,115 @@
+"""
+an append-only journal of everything that happens to a game, so a game can be replayed exactly, e.g. to reproduce a
+bug or to rebuild a game that was lost in a crash
+
+each event is a json array on its own line, [kind, seconds since the game was created, *arguments]. the first one
+describes the game itself, including its rng seed, so replaying every command against a game made from it deals the
+same roles and draws the same random numbers
+
+    python -m opendere.journal some-game.jsonl
+"""
+import itertools
+import json
+import os
+import sys
+import time
+from urllib.parse import quote
+
+from opendere import clock, game
+
+
+class Journal:
+    def __init__(self, path, buffer_size=64, clock=clock.default):
+        """
+        path (str): the file to append to
+        buffer_size (int): how many events to hold before writing them all out. Game also flushes every phase change.
+                             a crash loses whatever is still held, up to buffer_size - 1 commands, so 1 writes every
+                             event as it happens and a bigger buffer trades that for fewer writes
+        clock (MonotonicClock): the clock the game runs on
+        """
+        self.path = path
+        self.buffer_size = buffer_size
+        self.clock = clock
+        self._buffer = []
+        self._started = clock.now()
+
+    def record(self, kind, *args):
+        self._buffer.append(json.dumps([kind, round(self.clock.now() - self._started, 2), *args], separators=(',', ':')))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        with open(self.path, 'a') as f:
+            f.write('\n'.join(self._buffer) + '\n')
+        self._buffer = []
+
+
+def new_path(directory, channel):
+    """
+    a file for a new journal of the game in channel, named after the channel and the time, created empty so no other
+    game started in the same second gets it too. directory is created if need be
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"{quote(channel, safe='')}-{time.strftime('%Y%m%d-%H%M%S')}"
+    for n in itertools.count():
+        path = os.path.join(directory, f"{name}-{n}.jsonl" if n else f"{name}.jsonl")
+        try:
+            open(path, 'x').close()
+            return path
+        except FileExistsError:
+            continue
+
+
+def read(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay(events, messages=None):
+    """
+    rebuild a game from its journal events, as fast as it can go
+    the game runs on a virtual clock moved to each event's time, so the times in its messages match the original's
+    messages (list): if given, everything the game said while replaying is appended to it
+    returns the game, or None if the journal ends with the game being reset
+    """
+    g = None
+    replay_clock = clock.VirtualClock()
+    for kind, t, *args in events:
+        replay_clock.advance_to(t)
+        if kind == 'game':
+            channel, bot, name, prefix, allow_late, seed, rng_backend = args
+            g = game.Game(channel, bot, name, prefix, allow_late, seed=seed, rng_backend=rng_backend, clock=replay_clock)
+            continue
+        elif kind == 'reset':
+            return None
+
+        try:
+            result = {
+                'join': g.join_game,
+                'action': g.user_action,
+                'extend': g.user_extend,
+                'hurry': g.user_hurry,
+                'nick': g._nick_change,
+                'phase': g._phase_change,
+            }[kind](*args)
+        except game.InsufficientPlayersError:
+            return g
+        if messages is not None and result:
+            messages.extend(result)
+    return g
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    messages = []
+    g = replay(read(argv[0]), messages)
+    for recipient, text in messages:
+        print(f"{recipient}: {text}")
+    if g is not None and g.phase is not None:
+        print(f"-- phase {g.phase} ({g.phase_name}), alive: {', '.join(f'{u.nick} ({u.role.name})' for u in g.alive.values())}")
+
+
+if __name__ == '__main__':
+    main()
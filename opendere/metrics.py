@@ -0,0 +1,152 @@
+"""
+cheap counters and latency histograms for the hot paths, readable as prometheus text or a short summary
+
+recording is a dict lookup, a bisect and two additions, so it's left on everywhere. Game, GameServer and the
+frontends all record into metrics.default unless given their own Registry
+"""
+import bisect
+import os
+import threading
+
+
+# seconds, from 10us to 10s, for histograms named *_seconds
+BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+# for histograms of anything else, e.g. queue lengths
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    __slots__ = ('bounds', 'buckets', 'count', 'sum')
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        the upper bound of the bucket the q-th quantile falls in, which is as precise as a histogram gets
+        """
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Registry:
+    """
+    metrics by (name, labels), labels being a tuple of (label, value) pairs
+    """
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, n=1, **labels):
+        key = (name, tuple(labels.items()))
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def set(self, name, value, **labels):
+        self.gauges[(name, tuple(labels.items()))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(labels.items()))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram(BUCKETS if name.endswith('_seconds') else SIZE_BUCKETS))
+        histogram.observe(value)
+
+    def render(self):
+        """
+        everything in prometheus' text exposition format
+        """
+        lines = []
+        typed = set()
+
+        def labels(pairs, extra=()):
+            pairs = (*pairs, *extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+        def type_line(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, pairs), value in sorted(list(self.counters.items()), key=_sort_key):
+            type_line(name, 'counter')
+            lines.append(f"{name}{labels(pairs)} {value}")
+        for (name, pairs), value in sorted(list(self.gauges.items()), key=_sort_key):
+            type_line(name, 'gauge')
+            lines.append(f"{name}{labels(pairs)} {value}")
+        for (name, pairs), histogram in sorted(list(self.histograms.items()), key=_sort_key):
+            type_line(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip((*histogram.bounds, '+Inf'), histogram.buckets):
+                cumulative += n
+                lines.append(f"{name}_bucket{labels(pairs, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{labels(pairs)} {histogram.sum}")
+            lines.append(f"{name}_count{labels(pairs)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        # write then rename, so a scrape never reads half a file
+        with open(path + '.tmp', 'w') as f:
+            f.write(self.render())
+        os.replace(path + '.tmp', path)
+
+    def summary(self, max_length=400):
+        """
+        a summary for chat, e.g. the !stats command, as lines of at most max_length characters so none gets cut off,
+        see Outbox.max_length
+        """
+        parts = []
+        for (name, pairs), histogram in sorted(list(self.histograms.items()), key=_sort_key):
+            if not histogram.count:
+                continue
+            label = ','.join(str(v) for _, v in pairs)
+            average, p99 = histogram.sum / histogram.count, histogram.quantile(0.99)
+            if name.endswith('_seconds'):
+                name = name.removesuffix('_seconds')
+                average, p99 = f"{average * 1000:.2f}ms", f"{p99 * 1000:g}ms"
+            else:
+                average = f"{average:.1f}"
+            parts.append(f"{name.removeprefix('opendere_')}{f'[{label}]' if label else ''}: n={histogram.count} avg={average} p99<={p99}")
+        for (name, pairs), value in sorted(list(self.counters.items()), key=_sort_key):
+            label = ','.join(str(v) for _, v in pairs)
+            parts.append(f"{name.removeprefix('opendere_')}{f'[{label}]' if label else ''}: {value}")
+        if not parts:
+            return ['nothing recorded yet.']
+        lines = [parts[0]]
+        for part in parts[1:]:
+            if len(lines[-1]) + len('; ') + len(part) <= max_length:
+                lines[-1] += '; ' + part
+            else:
+                lines.append(part)
+        return lines
+
+
+def _sort_key(item):
+    (name, pairs), _ = item
+    return name, [(k, str(v)) for k, v in pairs]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+default = Registry()
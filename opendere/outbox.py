@@ -0,0 +1,108 @@
+import threading
+import time
+
+
+class Outbox:
+    """
+    a single queue for everything the frontend sends, so a phase change can't flood the server:
+    - lines queued for the same recipient are coalesced into as few messages as fit in max_length
+    - channel announcements always go out before private messages
+    - sends are paced by a token bucket, burst messages at once and then rate messages per second
+    """
+    separator = ' | '
+
+    def __init__(self, channels, rate=1.0, burst=5, max_length=400, clock=time.monotonic):
+        """
+        channels (Iterable[str]): recipients that are channels, anything else is a player
+        rate (float): messages per second once the burst is used up
+        burst (int): messages that can be sent back to back after a quiet spell
+        max_length (int): longest coalesced message, in characters. lines longer than this are sent on their own
+        """
+        self.channels = set(channels)
+        self.rate = rate
+        self.burst = burst
+        self.max_length = max_length
+        self.clock = clock
+        self._tokens = burst
+        self._refilled = clock()
+        # recipient -> lines waiting for them, in the order recipients first got something queued
+        self._channel_lines = {}
+        self._private_lines = {}
+        self._condition = threading.Condition()
+        self.sent = 0
+
+    def __len__(self):
+        with self._condition:
+            return sum(map(len, self._channel_lines.values())) + sum(map(len, self._private_lines.values()))
+
+    def put(self, messages):
+        """
+        messages (Iterable[Tuple[str, str]]): (recipient, text) tuples, as returned by Game
+        """
+        if not messages:
+            return
+        with self._condition:
+            for recipient, text in messages:
+                lines = self._channel_lines if recipient in self.channels else self._private_lines
+                lines.setdefault(recipient, []).append(text)
+            self._condition.notify_all()
+
+    def pop(self):
+        """
+        the next (recipient, text, is_channel) to send if the token bucket allows it right now, otherwise None
+        """
+        with self._condition:
+            if not self._channel_lines and not self._private_lines:
+                return None
+            self._refill()
+            if self._tokens < 1:
+                return None
+            self._tokens -= 1
+            self.sent += 1
+            is_channel = bool(self._channel_lines)
+            lines = self._channel_lines if is_channel else self._private_lines
+            recipient = next(iter(lines))
+            return recipient, self._coalesce(lines, recipient), is_channel
+
+    def wait(self, timeout=None):
+        """
+        block until there's something to send and a token to send it with, or until timeout
+        """
+        with self._condition:
+            if not self._channel_lines and not self._private_lines:
+                self._condition.wait(timeout)
+                return
+            self._refill()
+            if self._tokens < 1:
+                delay = (1 - self._tokens) / self.rate
+                self._condition.wait(delay if timeout is None else min(delay, timeout))
+
+    def run(self, send, stop_event):
+        """
+        send(recipient, text, is_channel) everything as it becomes due, until stop_event is set
+        """
+        while not stop_event.is_set():
+            message = self.pop()
+            if message is None:
+                self.wait(timeout=1)
+                continue
+            send(*message)
+
+    def stop(self, stop_event):
+        with self._condition:
+            stop_event.set()
+            self._condition.notify_all()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _coalesce(self, lines, recipient):
+        queued = lines[recipient]
+        text = queued.pop(0)
+        while queued and len(text) + len(self.separator) + len(queued[0]) <= self.max_length:
+            text += self.separator + queued.pop(0)
+        if not queued:
+            del lines[recipient]
+        return text
@@ -0,0 +1,145 @@
+"""
+a flight recorder for phase changes that take too long
+
+a Game given a Recorder runs _phase_change and _process_phase_actions through Recorder.watch. a call that finishes
+within the budget costs a copy of the queued actions list, two clock reads and two trips through a lock. nothing is
+sampled or written. a watchdog thread sleeps until some call's budget runs out, then grabs that call's stack every
+interval seconds into a ring buffer. once the call returns, what was queued and voted on going in, the stack samples
+and the messages coming out are written to a json file, so a night that took seconds to resolve leaves something
+behind to look at
+"""
+import collections
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+
+class Recorder:
+    def __init__(self, directory, budget=1.0, interval=0.005, max_samples=1000, max_dumps=100):
+        """
+        directory (str): where captures are written, created if need be
+        budget (float): seconds a call can take before it's captured
+        interval (float): seconds between stack samples once a call is over budget
+        max_samples (int): stack samples kept per call, the oldest are dropped first
+        max_dumps (int): how many of the latest capture paths dumps remembers. the files themselves are all kept
+        dumps (Deque[str]): paths of the latest captures written
+        """
+        self.directory = directory
+        self.budget = budget
+        self.interval = interval
+        self.max_samples = max_samples
+        self.max_dumps = max_dumps
+        self.dumps = collections.deque(maxlen=max_dumps)
+        # so captures written within the same second don't overwrite each other
+        self._counter = itertools.count()
+        self._watching = {}  # thread id -> (deadline, samples) of the call running on that thread
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def __reduce__(self):
+        # so a ShardedServer can hand one to its workers, which get a watchdog of their own
+        return type(self), (self.directory, self.budget, self.interval, self.max_samples, self.max_dumps)
+
+    def watch(self, game, name, call):
+        """
+        call() on behalf of game, capturing it if it takes longer than the budget
+        name (str): what's being called, e.g. '_phase_change'
+        """
+        thread_id = threading.get_ident()
+        if thread_id in self._watching:
+            # e.g. _process_phase_actions from inside _phase_change, which already covers it
+            return call()
+
+        # both are replaced or emptied by the call, so keep what they were going in
+        actions = list(game.phase_actions)
+        ballots = game.ballots
+        phase = game.phase
+        samples = collections.deque(maxlen=self.max_samples)
+        started = time.perf_counter()
+        with self._condition:
+            self._watching[thread_id] = (started + self.budget, samples)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='opendere-recorder', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+        messages = error = None
+        try:
+            messages = call()
+            return messages
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            with self._condition:
+                del self._watching[thread_id]
+            if seconds > self.budget:
+                self._dump(game, name, phase, seconds, actions, ballots, samples, messages, error)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def _run(self):
+        with self._condition:
+            while not self._closed:
+                now = time.perf_counter()
+                deadlines = [deadline for deadline, _ in self._watching.values()]
+                if not deadlines or min(deadlines) > now:
+                    self._condition.wait(min(deadlines) - now if deadlines else None)
+                    continue
+                # sampled with the lock held, so a call can't finish and be written out halfway through
+                frames = sys._current_frames()
+                for thread_id, (deadline, samples) in self._watching.items():
+                    if deadline <= now and thread_id in frames:
+                        samples.append(_stack(frames[thread_id]))
+                del frames
+                self._condition.wait(self.interval)
+
+    def _dump(self, game, name, phase, seconds, actions, ballots, samples, messages, error):
+        game.metrics.inc('opendere_slow_calls_total', call=name)
+        capture = {
+            'game': game.channel,
+            'call': name,
+            'phase': phase,
+            'seconds': seconds,
+            'budget': self.budget,
+            'phase_actions': [[type(a).__name__, _nick(a.user), _nick(a.target_user)] for a in actions],
+            'ballots': [
+                [command_public, ballot_phase and ballot_phase.name, {voter.nick: _nick(target) for voter, target in ballot.items()}]
+                for (command_public, ballot_phase), ballot in ballots.items()
+            ],
+            # collapsed stacks, outermost frame first, with how many samples each was seen in
+            'samples': collections.Counter(samples).most_common(),
+            'messages': messages,
+            'error': None if error is None else repr(error),
+        }
+        path = os.path.join(self.directory, f"slow-{quote(game.channel, safe='')}-{phase}-{name.strip('_')}-{time.strftime('%Y%m%d-%H%M%S')}-{next(self._counter)}.json")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(capture, f, default=repr)
+        except OSError:
+            # a full disk shouldn't take the game down with it
+            game.metrics.inc('opendere_slow_call_dump_errors_total')
+            return
+        self.dumps.append(path)
+
+
+def _nick(user):
+    return None if user is None else user.nick
+
+
+def _stack(frame):
+    stack = []
+    while frame is not None:
+        stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
@@ -0,0 +1,85 @@
+"""
+random number generators for games. every Game draws from its own seeded stream, so a game can be reproduced from
+its seed, and games don't disturb each other's randomness
+
+the stdlib backend is the default. numpy is slow to import, so the numpy backend only imports it when one is made,
+which is only worth it for big batches of draws, e.g. dealing roles for simulations
+"""
+import random
+import secrets
+
+
+def new_seed():
+    return secrets.randbits(32)
+
+
+class StdlibRNG:
+    name = 'stdlib'
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self._random = random.Random(seed)
+
+    def random(self):
+        return self._random.random()
+
+    def randrange(self, n):
+        return self._random.randrange(n)
+
+    def choice(self, seq):
+        return self._random.choice(seq)
+
+    def shuffle(self, seq):
+        self._random.shuffle(seq)
+
+    def alias_draws(self, prob, alias, num_draws):
+        """
+        num_draws indices from Vose alias tables, see WeightedSampler
+        """
+        draws = []
+        for _ in range(num_draws):
+            i = self._random.randrange(len(prob))
+            draws.append(i if self._random.random() < prob[i] else alias[i])
+        return draws
+
+
+class NumpyRNG:
+    name = 'numpy'
+
+    def __init__(self, seed=None):
+        import numpy  # only now, see the module docstring
+        self._numpy = numpy
+        self.seed = seed
+        self._generator = numpy.random.default_rng(seed)
+
+    def random(self):
+        return float(self._generator.random())
+
+    def randrange(self, n):
+        return int(self._generator.integers(n))
+
+    def choice(self, seq):
+        return seq[self.randrange(len(seq))]
+
+    def shuffle(self, seq):
+        self._generator.shuffle(seq)
+
+    def alias_draws(self, prob, alias, num_draws):
+        prob, alias = self._numpy.asarray(prob), self._numpy.asarray(alias)
+        i = self._generator.integers(len(prob), size=num_draws)
+        return self._numpy.where(self._generator.random(num_draws) < prob[i], i, alias[i]).tolist()
+
+
+backends = {backend.name: backend for backend in [StdlibRNG, NumpyRNG]}
+
+
+def new(seed=None, backend='stdlib'):
+    """
+    seed (int): seeds the stream, a new random seed is picked if it's None
+    backend (str): 'stdlib' or 'numpy'
+    """
+    return backends[backend](new_seed() if seed is None else seed)
+
+
+# for the odd draw made outside of any game
+default = StdlibRNG()
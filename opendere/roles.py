@@ -1,10 +1,9 @@
 from enum import Enum
 import inspect
 import math
-from numpy import random
 from datetime import datetime, timedelta
 
-from opendere import ability
+from opendere import ability, rng
 
 
 class Alignment(Enum):
@@ -18,34 +17,81 @@ class Phase(Enum):
     night = 1
 
 
-class Role:
+class RoleType(type):
+    """
+    freezes each role class's abilities, upgrades and appearances into tuples when the class is defined, so every
+    instance shares them as flyweights, and gives each role class empty __slots__ so instances stay dict-free
+
+    it also compiles the class's dispatch table, commands: (command name or alias, Phase) -> Ability, so finding
+    what a command does is a single lookup, and abilities_by_phase: Phase -> the abilities usable then
+    """
+    def __new__(mcs, name, bases, namespace):
+        namespace.setdefault('__slots__', ())
+        for attr in ['abilities', 'upgrades', 'appearances']:
+            if namespace.get(attr) is not None:
+                namespace[attr] = tuple(namespace[attr])
+        cls = super().__new__(mcs, name, bases, namespace)
+        if cls.appearances is None and cls.name is not None:
+            cls.appearances = (cls.name,)
+
+        cls.commands = {}
+        for role_ability in cls.abilities:
+            for command in (role_ability.name, *role_ability.aliases):
+                for phase in role_ability.phases:
+                    if (command, phase) in cls.commands:
+                        raise TypeError(f"{name} has more than one ability for {command} during the {phase.name}")
+                    cls.commands[command, phase] = role_ability
+        cls.abilities_by_phase = {
+            phase: tuple(role_ability for role_ability in cls.abilities if phase in role_ability.phases)
+            for phase in Phase
+        }
+        return cls
+
+
+class Role(metaclass=RoleType):
     """
     name (string): name of the role
     is_yandare (boolean): killing all the yandere wins the game
     default_alignment (boolean): the alignment at the start of game
-    ability (Ability): the ability of the role
-    upgrades (list[Role]): the possible roles that can be upgraded to
-    appearance (list[str]): the list of possible appearances a role can have to spies
+    ability (Tuple[Ability]): the abilities of the role, shared by every instance of it
+    upgrades (Tuple[Role]): the possible roles that can be upgraded to
+    appearance (Tuple[str]): the list of possible appearances a role can have to spies
     safe_to_guard (boolean): whether GuardAbility dies when guarding you
+    appear_as (str): what this particular instance appears as
+    uses (Dict[Ability, int]): uses left of the abilities this instance has used so far, None until it's used any
     """
+    __slots__ = ('appear_as', 'uses')
     name = None
     is_yandere = None
     default_alignment = None
-    abilities = []
-    upgrades = []
+    abilities = ()
+    upgrades = ()
     appearances = None
     safe_to_guard = True
 
-    def __init__(self):
+    def __init__(self, rng=rng.default):
         assert isinstance(self.name, str)
         assert isinstance(self.is_yandere, bool)
         assert isinstance(self.default_alignment, Alignment)
         assert isinstance(self.safe_to_guard, bool)
 
-        self.abilities = list(self.abilities)
-        self.upgrades = list(self.upgrades)
-        self.appearances = self.appearances or [self.name]
-        self.appear_as = random.choice(self.appearances)
+        self.appear_as = rng.choice(self.appearances)
+        self.uses = None
+
+    def uses_left(self, ability):
+        if self.uses is None:
+            return ability.num_uses
+        return self.uses.get(ability, ability.num_uses)
+
+    def use(self, ability):
+        """
+        use up one use of a limited ability. unlimited ones aren't tracked at all
+        """
+        if ability.num_uses == math.inf:
+            return
+        if self.uses is None:
+            self.uses = {}
+        self.uses[ability] = self.uses_left(ability) - 1
 
     @property
     def description(self):
@@ -117,7 +163,7 @@ class Ronin(Role):
         ability.KillAbility(num_uses=1, phases=[Phase.day]),
         ability.VoteKillAbility(num_uses=math.inf, phases=[Phase.day], command_public=True),
     ]
-    upgrades = [Samurai],
+    upgrades = [Samurai]
 
 
 class Shisho(Role):
@@ -138,7 +184,7 @@ class Sensei(Role):
         ability.UpgradeAbility(num_uses=1, phases=[Phase.day]),
         ability.VoteKillAbility(num_uses=math.inf, phases=[Phase.day], command_public=True),
     ]
-    upgrades = [Shisho],
+    upgrades = [Shisho]
 
 
 class Idol(Role):
@@ -149,7 +195,7 @@ class Idol(Role):
         ability.RevealAbility(num_uses=math.inf, phases=[Phase.day]),
         ability.VoteKillAbility(num_uses=math.inf, phases=[Phase.day], command_public=True),
     ]
-    upgrades = [Sensei, Ronin],
+    upgrades = [Sensei, Ronin]
 
 
 class Janitor(Role):
@@ -326,7 +372,7 @@ class BakaRanger(Role):
     abilities = [
         ability.VoteKillAbility(num_uses=math.inf, phases=[Phase.day], command_public=True),
     ]
-    upgrades = [PsychicIdiot, IdiotSavant, Myth, NullCarrier],
+    upgrades = [PsychicIdiot, IdiotSavant, Myth, NullCarrier]
 
 
 class YandereSpy(Role):
@@ -442,3 +488,6 @@ class Trap(Role):
 
 # hack
 all_role_classes = [l for l in locals().values() if inspect.isclass(l) and issubclass(l, Role) and l != Role]
+
+# every command any role has, so anything else can be thrown away without looking at the player at all
+all_commands = frozenset(command for role in all_role_classes for command, _ in role.commands)
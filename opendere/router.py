@@ -0,0 +1,131 @@
+"""
+one pass from a chat line to what it asks for
+
+every command anyone can use, game commands from roles.all_commands plus the server's own, is compiled into a
+single table when the Router is built. a line is split once and its first word looked up in that table, so chatter,
+including other bots' ! commands, is dropped after one lookup. frontends that filter lines themselves can use
+Router.pattern, which only matches lines the table knows, and Router.private_pattern for private lines without the
+prefix
+"""
+import re
+from collections import namedtuple
+
+from opendere import roles
+
+
+JOIN = 'join'
+RESET = 'reset'
+EXTEND = 'extend'
+HURRY = 'hurry'
+UNVOTE = 'unvote'
+STATS = 'stats'
+PLAYERS = 'players'
+HELP = 'help'
+ABILITY = 'ability'
+
+commands = {
+    JOIN: {'opendere'},
+    RESET: {'e', 'end', 'r', 'reset', 'restart'},
+    EXTEND: {'extend'},
+    HURRY: {'h', 'hurry', 'hayaku'},
+    UNVOTE: {'a', 'u', 'abstain', 'unvote'},  # aliases for 'vote abstain' and 'vote undecided'
+    STATS: {'stats'},
+    PLAYERS: {'players', 'roster'},  # the paged list of who's still alive, mostly for big lobbies
+    HELP: {'help'},
+    ABILITY: roles.all_commands,
+}
+
+# every ability command or alias -> the ability's own name
+ability_names = {
+    command: role_ability.name
+    for role in roles.all_role_classes for role_ability in role.abilities
+    for command in (role_ability.name, *role_ability.aliases)
+}
+
+
+# kind (str): one of the kinds above
+# command (str): the lowercased command, e.g. 'vote'
+# args (str): the rest of the line, e.g. 'kitties' for '!vote kitties', or '' if there's nothing else
+Route = namedtuple('Route', ['kind', 'command', 'args'])
+
+
+def name(route):
+    """
+    what route's command is called whichever alias was used, e.g. 'hurry' for '!h' and 'vote' for '!v', so there's
+    one name per command to label metrics with
+    """
+    if route.kind == ABILITY:
+        return ability_names.get(route.command, route.command)
+    return route.kind
+
+
+class Router:
+    def __init__(self, prefix='!', names=()):
+        """
+        prefix (str): what public commands start with
+        names (Iterable[str]): extra names games answer to, e.g. a channel's name, see Game.name. like 'opendere', a
+            name on its own joins the game, and in front of a command addresses the game, e.g. '!opendere vote kitties'
+        """
+        self.prefix = prefix
+        self.table = {}
+        for kind, words in commands.items():
+            for word in words:
+                self.table[word] = kind
+        for name in names:
+            self.add(name, JOIN)
+
+    def add(self, word, kind):
+        """
+        teach the router another command, unless it already has one by that name
+        """
+        self.table.setdefault(word.lower(), kind)
+
+    def _words(self):
+        # longest first, so no command is cut short by another it starts with
+        return '|'.join(re.escape(word) for word in sorted(self.table, key=len, reverse=True))
+
+    @property
+    def pattern(self):
+        """
+        a regex matching exactly the public lines parse() doesn't drop
+        """
+        return f"(?i)^{re.escape(self.prefix)}({self._words()})(\\s|$)"
+
+    @property
+    def private_pattern(self):
+        """
+        a regex matching the private lines parse() doesn't drop that pattern misses, i.e. commands without the prefix
+        """
+        return f"(?i)^({self._words()})(\\s|$)"
+
+    def parse(self, text, public=True):
+        """
+        text (str): the line as it was said
+        public (bool): whether it was said in a channel, where commands need the prefix. it's optional in private
+        returns a Route, or None if the line isn't a command
+        """
+        if text.startswith(self.prefix):
+            text = text[len(self.prefix):]
+        elif public:
+            return None
+        words = text.split(maxsplit=1)
+        if not words:
+            return None
+        command = words[0].lower()
+        kind = self.table.get(command)
+        if kind is None:
+            return None
+        args = words[1].strip() if len(words) > 1 else ''
+        # '!opendere vote kitties' is '!vote kitties' addressed to the game
+        if kind == JOIN and args:
+            route = self.parse(args, public=False)
+            if route is not None and route.kind != JOIN:
+                return route
+        return Route(kind, command, args)
+
+    @staticmethod
+    def joins(route, channel):
+        """
+        whether route joins the game in channel, i.e. it's '!opendere' or the channel's own name, e.g. '!games' in #games
+        """
+        return route.kind == JOIN and (route.command in commands[JOIN] or route.command == channel.lstrip('#').lower())
@@ -0,0 +1,38 @@
+from opendere import rng
+
+
+class WeightedSampler:
+    """
+    draws from a fixed {choice: weight} table using Vose's alias method. the tables are built once, after which a
+    draw costs one random index and one coin flip no matter how many choices there are, and a batch of draws is a
+    couple of vectorized calls on the numpy rng backend
+    """
+    def __init__(self, choice_weight_map):
+        self.choices = list(choice_weight_map)
+        num_choices = len(self.choices)
+        weight_sum = sum(choice_weight_map.values())
+        scaled = [choice_weight_map[c] * num_choices / weight_sum for c in self.choices]
+
+        prob = [1.0] * num_choices
+        alias = list(range(num_choices))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+        # whatever's left over is only off from 1 by float rounding
+        self._prob = tuple(prob)
+        self._alias = tuple(alias)
+
+    def __len__(self):
+        return len(self.choices)
+
+    def sample(self, rng=rng.default):
+        i = rng.randrange(len(self.choices))
+        return self.choices[i if rng.random() < self._prob[i] else self._alias[i]]
+
+    def sample_many(self, num_choices, rng=rng.default):
+        return [self.choices[i] for i in rng.alias_draws(self._prob, self._alias, num_choices)]
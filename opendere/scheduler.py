@@ -0,0 +1,116 @@
+import heapq
+import itertools
+import logging
+import threading
+
+from opendere import clock
+
+
+log = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """
+    a min-heap of game phase deadlines, so whoever runs the games only has to wake up when the earliest one expires
+    instead of polling every game every tick
+
+    games (re)schedule themselves whenever their Game.phase_end changes. stale heap entries aren't removed when a game
+    is rescheduled or cancelled, they're just skipped when they reach the top of the heap
+    """
+    # seconds until a game is tried again when its callback raised before giving it a new deadline
+    retry_delay = 5
+
+    def __init__(self):
+        self._heap = []
+        self._deadlines = {}  # game -> its current deadline
+        self._counter = itertools.count()  # tie-breaker, so games never have to be compared
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, game):
+        return game in self._deadlines
+
+    def schedule(self, game, deadline):
+        """
+        game (Game): the game to wake up
+        deadline (float): when to wake it up, in clock seconds, replacing any previously scheduled deadline
+        """
+        with self._condition:
+            self._deadlines[game] = deadline
+            heapq.heappush(self._heap, (deadline, next(self._counter), game))
+            # only wake the runner if the earliest deadline moved
+            if self._heap[0][2] is game:
+                self._changed()
+
+    def cancel(self, game):
+        with self._condition:
+            self._deadlines.pop(game, None)
+
+    def next_deadline(self):
+        """
+        the earliest live deadline, or None if nothing is scheduled
+        """
+        with self._condition:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """
+        remove and return every game whose deadline is at or before now, earliest first
+        """
+        due = []
+        with self._condition:
+            while True:
+                self._discard_stale()
+                if not self._heap or self._heap[0][0] > now:
+                    return due
+                deadline, _, game = heapq.heappop(self._heap)
+                del self._deadlines[game]
+                due.append(game)
+
+    def run(self, callback, stop_event, clock=clock.default):
+        """
+        block, calling callback(game) for each game as its deadline expires, until stop_event is set
+        callback is responsible for rescheduling the game, which a phase change already does by setting Game.phase_end
+        clock (MonotonicClock): the clock the games' deadlines are on
+        """
+        while not stop_event.is_set():
+            now = clock.now()
+            for game in self.pop_due(now):
+                self._call(callback, game, now)
+            with self._condition:
+                deadline = self.next_deadline()
+                timeout = None if deadline is None else max(deadline - clock.now(), 0)
+                if timeout != 0:
+                    self._condition.wait(timeout)
+
+    def _call(self, callback, game, now):
+        """
+        callback(game), logging anything it raises instead of letting it take the rest of the due games down with it.
+        a game that didn't get a new deadline before failing is tried again in retry_delay seconds, so it isn't left
+        without one
+        """
+        try:
+            callback(game)
+        except Exception:
+            log.exception(f"phase timer of the game in {getattr(game, 'channel', game)} failed")
+            if game not in self:
+                self.schedule(game, now + self.retry_delay)
+
+    def stop(self, stop_event):
+        with self._condition:
+            stop_event.set()
+            self._changed()
+
+    def _changed(self):
+        # called with the lock held whenever the earliest deadline may have moved
+        self._condition.notify_all()
+
+    def _discard_stale(self):
+        while self._heap:
+            deadline, _, game = self._heap[0]
+            if self._deadlines.get(game) == deadline:
+                return
+            heapq.heappop(self._heap)
@@ -0,0 +1,400 @@
+"""
+an asyncio host for opendere games that isn't tied to any chat network
+
+one GameServer owns every game and the registry of who's playing where, and wakes games up with a single event loop
+timer for the earliest phase deadline. chat networks plug in through an Adapter, which turns what people say into
+GameServer.message calls and sends back whatever the games answer, so hundreds of channels can share one process and
+one thread, and games can be played without irc at all, see LocalAdapter
+"""
+import asyncio
+import fnmatch
+import time
+
+from opendere import clock, game, journal, metrics, router, scheduler
+
+
+class AsyncScheduler(scheduler.Scheduler):
+    """
+    a Scheduler that arms one event loop timer for the earliest deadline instead of blocking a thread on it
+    callback(game) is called on the loop for each game as its deadline expires
+    clock (MonotonicClock): the clock the games' deadlines are on
+    """
+    def __init__(self, callback, clock=clock.default):
+        super().__init__()
+        self.callback = callback
+        self.clock = clock
+        self.loop = None
+        self._timer = None
+
+    def start(self, loop):
+        self.loop = loop
+        self._changed()
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.loop = None
+
+    def _changed(self):
+        # games can be rescheduled from any thread, so the timer is always (re)armed on the loop itself
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._arm)
+
+    def _arm(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        deadline = self.next_deadline()
+        if deadline is not None and self.loop is not None:
+            self._timer = self.loop.call_later(max(deadline - self.clock.now(), 0), self._fire)
+
+    def _fire(self):
+        self._timer = None
+        now = self.clock.now()
+        try:
+            for g in self.pop_due(now):
+                self._call(self.callback, g, now)
+        finally:
+            # whatever happened, the games that are still due later need a timer
+            self._arm()
+
+
+class Adapter:
+    """
+    connects a chat network to a GameServer
+    subclasses pass incoming lines to server.message() and implement send()
+    """
+    def __init__(self, server, channels, nick='opendere'):
+        """
+        server (GameServer): the server to attach to
+        channels (Iterable[str]): the channels on this network that games can be played in
+        nick (str): the bot's name on this network, which players are told to PM their commands to
+        """
+        self.server = server
+        self.channels = set(channels)
+        self.nick = nick
+        server.attach(self)
+
+    def send(self, messages):
+        """
+        messages (List[Tuple[str, str]]): (recipient, text) tuples, recipient being one of self.channels or a player's uid
+        """
+        raise NotImplementedError
+
+
+class LocalAdapter(Adapter):
+    """
+    an in-memory network, for tests and for playing games without connecting to anything
+    """
+    def __init__(self, server, channels, nick='opendere'):
+        super().__init__(server, channels, nick)
+        self.sent = []
+
+    def say(self, uid, nick, text, channel=None):
+        """
+        uid says text in channel, or privately to the bot if channel is None
+        """
+        self.server.message(uid, nick, text, channel)
+
+    def send(self, messages):
+        self.sent.extend(messages)
+
+
+class DiscordAdapter(Adapter):
+    """
+    plugs a discord.py style client into the server. discord isn't imported here, the client only has to look like
+    discord.Client: get_channel(id), fetch_user(id), and messages with author, channel, guild and content
+    channels are channel ids as strings, uids are user ids as strings. the server has to run on the client's loop
+    """
+    def __init__(self, server, client, channels):
+        super().__init__(server, channels, str(getattr(client, 'user', None) or 'opendere'))
+        self.client = client
+
+    async def on_message(self, message):
+        if message.author == getattr(self.client, 'user', None):
+            return
+        # only a dm is private. anything said in a channel the games don't run in is just chatter, and has to be
+        # dropped here, since private commands don't need the prefix
+        channel = None
+        if message.guild is not None:
+            channel = str(message.channel.id)
+            if channel not in self.channels:
+                return
+        self.server.message(str(message.author.id), message.author.display_name, message.content, channel)
+
+    def send(self, messages):
+        for recipient, text in messages:
+            asyncio.ensure_future(self._send(recipient, text))
+
+    async def _send(self, recipient, text):
+        if recipient in self.channels:
+            await self.client.get_channel(int(recipient)).send(f"**{text}**")
+        else:
+            await (await self.client.fetch_user(int(recipient))).send(text)
+
+
+class GameServer:
+    """
+    every game, keyed by channel, and every player, keyed by uid, on one event loop
+    """
+    def __init__(self, prefix='!', journal_dir=None, snapshots=None, admins=(), metrics=metrics.default, metrics_path=None, metrics_interval=15, clock=clock.default, recorder=None):
+        """
+        prefix (str): what public commands start with
+        journal_dir (str): a directory to keep a replayable journal of every game in, see opendere.journal
+        snapshots (SnapshotStore): where to save running games to, see opendere.snapshot
+        admins (Iterable[str]): hostmasks allowed to use !stats, matched against uids with * and ? wildcards, e.g.
+                                'boss!*@staff.example.org'. a nick alone isn't enough, anyone can take a nick
+        metrics (Registry): where command latencies, scheduler lag and message counts are recorded, see opendere.metrics
+        metrics_path (str): a file to write the metrics to in prometheus' text format every metrics_interval seconds
+        clock (MonotonicClock): the clock every game runs on, see opendere.clock
+        recorder (Recorder): captures every game's phase changes that run over its budget, see opendere.recorder
+        """
+        self.prefix = prefix
+        self.journal_dir = journal_dir
+        self.snapshots = snapshots
+        self.admins = [mask.casefold() for mask in admins]
+        self.metrics = metrics
+        self.metrics_path = metrics_path
+        self.metrics_interval = metrics_interval
+        self.router = router.Router(prefix)
+        self.games = dict()
+        self.players = dict()  # uid -> channel of the game they're playing in, for routing private commands
+        self.identities = game.IdentityIndex()  # the same uids, to find players who've come back with a new nick or host
+        self.gone = set()  # uids of players whose connection went away, the only seats someone else can pick up
+        self.adapters = dict()  # channel -> the adapter of the network it's on
+        self.clock = clock
+        self.recorder = recorder
+        self.scheduler = AsyncScheduler(self.tick, clock)
+        self.loop = None
+        self._stopped = None
+
+    def attach(self, adapter):
+        for channel in adapter.channels:
+            self.adapters[channel] = adapter
+            self.router.add(channel.lstrip('#'), router.JOIN)
+
+    async def serve(self):
+        """
+        run until stop() is called, restoring any saved games first
+        """
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        if self.snapshots is not None:
+            for g in self.snapshots.load_all(scheduler=self.scheduler, clock=self.clock, recorder=self.recorder):
+                if g.channel in self.adapters:
+                    self.games[g.channel] = g
+                    for uid in g.users:
+                        self._seat(uid, g.channel)
+        self.scheduler.start(self.loop)
+        writer = asyncio.ensure_future(self._write_metrics()) if self.metrics_path else None
+        try:
+            await self._stopped.wait()
+        finally:
+            if writer is not None:
+                writer.cancel()
+            self.scheduler.close()
+            self.loop = None
+
+    async def _write_metrics(self):
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            self.metrics.set('opendere_games', len(self.games))
+            self.metrics.set('opendere_players', len(self.players))
+            try:
+                self.metrics.write(self.metrics_path)
+            except OSError:
+                pass
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stopped.set)
+
+    def submit(self, fn, *args):
+        """
+        call fn(*args) on the server's loop from another thread, e.g. a frontend's own handler threads
+        returns a concurrent.futures.Future, or None if the server isn't running
+        """
+        if self.loop is None:
+            return None
+        async def call():
+            return fn(*args)
+        return asyncio.run_coroutine_threadsafe(call(), self.loop)
+
+    def new_game(self, channel):
+        j = None
+        if self.journal_dir:
+            # a journal is for rebuilding games lost in a crash, so don't hold anything back from it
+            j = journal.Journal(journal.new_path(self.journal_dir, channel), buffer_size=1, clock=self.clock)
+        g = game.Game(channel, self.adapters[channel].nick, channel.lstrip('#'), self.prefix, scheduler=self.scheduler, journal=j, clock=self.clock, recorder=self.recorder)
+        self.games[channel] = g
+        return g
+
+    def end_game(self, channel):
+        """
+        forget a game and its players, call this before resetting the game since that forgets its users
+        """
+        g = self.games.pop(channel, None)
+        if self.snapshots is not None:
+            self.snapshots.delete(channel)
+        if g is None:
+            return
+        for uid in g.users:
+            if self.players.get(uid) == channel:
+                self._unseat(uid)
+
+    def _seat(self, uid, channel):
+        self.players[uid] = channel
+        self.identities.add(uid)
+
+    def _unseat(self, uid):
+        del self.players[uid]
+        self.identities.remove(uid)
+        self.gone.discard(uid)
+
+    def deliver(self, channel, messages):
+        if messages:
+            channel_messages = sum(recipient == channel for recipient, _ in messages)
+            self.metrics.inc('opendere_messages_total', channel_messages, kind='channel')
+            self.metrics.inc('opendere_messages_total', len(messages) - channel_messages, kind='private')
+            self.adapters[channel].send(messages)
+
+    def tick(self, g):
+        """
+        called by the scheduler when a game's phase timer runs out, i.e. the start timer or hurry timer
+        """
+        channel = g.channel
+        if self.games.get(channel) is not g:
+            return
+
+        # how late the scheduler woke the game up
+        if g.phase_end is not None:
+            self.metrics.observe('opendere_scheduler_lag_seconds', max(self.clock.now() - g.phase_end, 0))
+        try:
+            messages = g.tick()
+        except game.InsufficientPlayersError:
+            self.end_game(channel)
+            self.deliver(channel, [(channel, f"there aren't enough players to start a game of opendere in {channel}. please try again later.")])
+            return
+
+        self.deliver(channel, messages)
+        # if the game has ended or been reset
+        if g.channel is None:
+            self.end_game(channel)
+        elif messages and self.snapshots is not None:
+            self.snapshots.save(g)
+
+    def message(self, uid, nick, text, channel=None, admin=False):
+        """
+        handle anything a player says
+        uid (str): the player's unique identifier, see Game.join_game
+        nick (str): the player's nickname
+        text (str): what they said
+        channel (str): the channel they said it in, or None if they said it privately to the bot
+        admin (bool): whether the frontend knows them to be an admin, e.g. sopel's trigger.admin, on top of admins
+        """
+        # anything that isn't a command stops here, after one lookup
+        route = self.router.parse(text, public=channel is not None)
+        if route is None:
+            return
+        started = time.perf_counter()
+        try:
+            return self._message(uid, nick, text, channel, route, admin)
+        finally:
+            # commands are labelled by name rather than by whichever alias was typed, so there's one series each
+            self.metrics.observe('opendere_command_seconds', time.perf_counter() - started, command=router.name(route))
+
+    def _message(self, uid, nick, text, channel, route, admin=False):
+        # a command from someone the server doesn't know might be a player back with a new nick or host. anyone joining
+        # is someone new though, e.g. another player behind the same web client's user@host
+        if uid not in self.players and route.kind != router.JOIN:
+            self._reconnect(uid, nick)
+        # whoever's talking is clearly still here
+        self.gone.discard(uid)
+        if channel is None:
+            # join() makes sure a player is only ever in one game, so their uid maps to exactly one channel
+            channel = self.players.get(uid)
+            if channel is None:
+                return
+            g = self.games[channel]
+            messages = g.user_command(uid, route, None, text)
+        else:
+            if channel not in self.adapters:
+                return
+            elif self.router.joins(route, channel):
+                return self.join(uid, nick, channel)
+            elif route.kind == router.STATS:
+                if admin or self.is_admin(uid):
+                    self.deliver(channel, [(uid, line) for line in self.metrics.summary()])
+                return
+
+            g = self.games.get(channel)
+            if g is None:
+                return
+            elif route.kind == router.RESET:
+                self.end_game(channel)
+                g.reset()
+                return self.deliver(channel, [(channel, f"the current game in {channel} has been ended or reset.")])
+            elif route.kind == router.EXTEND:
+                messages = g.user_extend(uid)
+            elif route.kind == router.HURRY:
+                messages = g.user_hurry(uid)
+            else:
+                messages = g.user_command(uid, route, channel, text)
+
+        self.deliver(channel, messages)
+        # if the game has ended or been reset
+        if g.channel is None:
+            self.end_game(channel)
+
+    def is_admin(self, uid):
+        """
+        whether uid matches one of the admins' hostmasks
+        """
+        uid = uid.casefold()
+        return any(fnmatch.fnmatchcase(uid, mask) for mask in self.admins)
+
+    def nick_change(self, uid, new_uid, new_nick):
+        """
+        follow a player to a new uid and nick, e.g. on an irc NICK, so they don't drop out of their game
+        """
+        channel = self.players.get(uid)
+        if channel is None or (new_uid != uid and new_uid in self.players):
+            return
+        g = self.games[channel]
+        messages = g._nick_change(uid, new_uid, g.users[uid].nick, new_nick)
+        self._unseat(uid)
+        self._seat(new_uid, channel)
+        self.deliver(channel, messages)
+
+    def quit(self, uid):
+        """
+        a player's connection went away, e.g. an irc QUIT, PART or netsplit. they keep their seat, and whoever comes
+        back matching them takes it over, see _reconnect
+        """
+        if uid in self.players:
+            self.gone.add(uid)
+
+    def _reconnect(self, uid, nick):
+        # move the one player sharing two of nick, user and host with uid over to it, see IdentityIndex. only once
+        # they're known to be gone though, or anyone behind the same host could take over a seat still in use
+        old_uid = self.identities.match(uid)
+        if old_uid is not None and old_uid != uid and old_uid in self.gone:
+            return self.nick_change(old_uid, uid, nick)
+
+    def join(self, uid, nick, channel):
+        """
+        join an existing (or start a new) game in channel
+        """
+        # a player can only be in one game at a time, otherwise we can't tell which game their private commands are for.
+        # that goes for a player back with a new nick or host too, though someone matching a player in this same game
+        # joins as someone new, e.g. another player behind the same web client's user@host
+        playing_in = self.players.get(uid) or self.players.get(self.identities.match(uid), channel)
+        if playing_in != channel:
+            return self.deliver(channel, [(uid, f"you're already playing in the game in {playing_in}.")])
+
+        g = self.games.get(channel) or self.new_game(channel)
+        messages = g.join_game(uid, nick)
+        if uid in g.users and uid not in self.players:
+            self._seat(uid, channel)
+        self.deliver(channel, messages)
@@ -0,0 +1,277 @@
+"""
+games spread over worker processes, so one channel's slow phase change can't hold up every other channel and every
+core gets used
+
+each worker runs its own GameServer for the channels hashed to it. the front process keeps only the uid -> channel
+registry, sends each line to the worker that owns its channel, and gets the games' messages back over a
+multiprocessing pipe, no broker needed. ShardedServer takes the same adapters as GameServer
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import Future
+
+from opendere import game, router, server, snapshot
+
+
+def shard_of(channel, num_workers):
+    """
+    the worker that owns channel. stable across restarts, so each worker picks its own games back up from snapshots
+    """
+    return zlib.crc32(channel.encode()) % num_workers
+
+
+class PipeAdapter(server.Adapter):
+    """
+    a worker's side of one channel, messages go back to the front process tagged with the channel they're for
+    """
+    def __init__(self, worker_server, conn, channel, nick):
+        self.conn = conn
+        self.channel = channel
+        super().__init__(worker_server, [channel], nick)
+
+    def send(self, messages):
+        self.conn.send(('send', self.channel, messages))
+
+
+class WorkerServer(server.GameServer):
+    """
+    a GameServer that tells the front process whenever a player starts or stops playing, so it can route their
+    private commands
+    """
+    def __init__(self, conn, prefix='!', journal_dir=None, snapshots=None, admins=(), metrics_path=None, recorder=None):
+        super().__init__(prefix, journal_dir, snapshots, admins, metrics_path=metrics_path, recorder=recorder)
+        self.conn = conn
+
+    async def serve(self):
+        serving = asyncio.ensure_future(super().serve())
+        await asyncio.sleep(0)
+        # games restored from snapshots already have players
+        for uid, channel in self.players.items():
+            self.conn.send(('player', uid, channel))
+        threading.Thread(target=_listen, args=(self, self.conn), name='opendere-shard-listener', daemon=True).start()
+        await serving
+
+    def join(self, uid, nick, channel):
+        # the front holds a seat for anyone it forwards a join for, so it's told either way, see ShardedServer.message
+        playing = uid in self.players
+        try:
+            super().join(uid, nick, channel)
+        finally:
+            if not playing:
+                self.conn.send(('player', uid, self.players.get(uid)))
+
+    def nick_change(self, uid, new_uid, new_nick):
+        channel = self.players.get(uid)
+        super().nick_change(uid, new_uid, new_nick)
+        if channel is not None and new_uid != uid and self.players.get(new_uid) == channel:
+            self.conn.send(('player', uid, None))
+            self.conn.send(('player', new_uid, channel))
+
+    def quit(self, uid):
+        super().quit(uid)
+        if uid in self.gone:
+            self.conn.send(('gone', uid))
+
+    def end_game(self, channel):
+        g = self.games.get(channel)
+        uids = [] if g is None else [uid for uid in g.users if self.players.get(uid) == channel]
+        super().end_game(channel)
+        for uid in uids:
+            self.conn.send(('player', uid, None))
+
+
+def _listen(worker_server, conn):
+    while True:
+        try:
+            event = conn.recv()
+        except EOFError:
+            event = ('stop',)
+        kind, *args = event
+        if kind == 'stop':
+            worker_server.stop()
+            return
+        worker_server.submit({'message': worker_server.message, 'nick': worker_server.nick_change, 'quit': worker_server.quit}[kind], *args)
+
+
+async def _serve(conn, nicks, prefix, journal_dir, snapshot_dir, admins, metrics_path, recorder):
+    snapshots = None if snapshot_dir is None else snapshot.SnapshotStore(snapshot_dir)
+    worker_server = WorkerServer(conn, prefix, journal_dir, snapshots, admins, metrics_path, recorder)
+    for channel, nick in nicks.items():
+        PipeAdapter(worker_server, conn, channel, nick)
+    await worker_server.serve()
+
+
+def worker(conn, nicks, prefix='!', journal_dir=None, snapshot_dir=None, admins=(), metrics_path=None, recorder=None):
+    """
+    a worker process' main, serving the games of the channels in nicks (channel -> the bot's nick there)
+    """
+    asyncio.run(_serve(conn, nicks, prefix, journal_dir, snapshot_dir, admins, metrics_path, recorder))
+
+
+class ShardedServer:
+    """
+    a drop-in for GameServer that runs the games in num_workers worker processes
+    adapters attach to it as usual, then start() starts the workers
+    """
+    def __init__(self, num_workers=None, prefix='!', journal_dir=None, snapshot_dir=None, admins=(), metrics_path=None, recorder=None):
+        """
+        num_workers (int): worker processes to start, one per core by default
+        snapshot_dir (str): where workers save running games to, see opendere.snapshot
+        admins (Iterable[str]): hostmasks allowed to use !stats, which reports on the worker running that channel's game
+        metrics_path (str): each worker writes its own metrics next to this, e.g. opendere-shard0.prom for opendere.prom
+        recorder (Recorder): copied to each worker, whose slow phase changes it captures, see opendere.recorder
+        """
+        self.num_workers = num_workers or os.cpu_count()
+        self.prefix = prefix
+        self.journal_dir = journal_dir
+        self.snapshot_dir = snapshot_dir
+        self.admins = tuple(admins)
+        self.metrics_path = metrics_path
+        self.recorder = recorder
+        self.players = dict()  # uid -> channel, as reported by the workers
+        self.identities = game.IdentityIndex()  # the same uids, to route private commands from players who've reconnected
+        self.gone = set()  # uids the workers say have quit, whose seats someone matching them can pick up
+        self._players_lock = threading.Lock()
+        self.adapters = dict()
+        self._conns = []
+        self._locks = []
+        self._processes = []
+        self._listeners = []
+        self.router = router.Router(prefix)
+
+    def attach(self, adapter):
+        for channel in adapter.channels:
+            self.adapters[channel] = adapter
+            self.router.add(channel.lstrip('#'), router.JOIN)
+
+    def start(self):
+        nicks = [dict() for _ in range(self.num_workers)]
+        for channel, adapter in self.adapters.items():
+            nicks[shard_of(channel, self.num_workers)][channel] = adapter.nick
+        for i, shard_nicks in enumerate(nicks):
+            metrics_path = None
+            if self.metrics_path:
+                base, extension = os.path.splitext(self.metrics_path)
+                metrics_path = f"{base}-shard{i}{extension}"
+            conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=worker, args=(child_conn, shard_nicks, self.prefix, self.journal_dir, self.snapshot_dir, self.admins, metrics_path, self.recorder),
+                name='opendere-shard', daemon=True
+            )
+            process.start()
+            # so the listener sees the pipe close when the worker exits
+            child_conn.close()
+            listener = threading.Thread(target=self._listen, args=(conn,), name='opendere-shard-listener', daemon=True)
+            listener.start()
+            self._conns.append(conn)
+            self._locks.append(threading.Lock())
+            self._processes.append(process)
+            self._listeners.append(listener)
+
+    def stop(self):
+        for i in range(len(self._conns)):
+            self._send(i, ('stop',))
+        for process in self._processes:
+            process.join(timeout=5)
+        for listener in self._listeners:
+            listener.join(timeout=5)
+        self._conns, self._locks, self._processes, self._listeners = [], [], [], []
+
+    def submit(self, fn, *args):
+        """
+        sending to a worker never blocks on the game, so this just calls fn(*args) and hands back its result, or what
+        it raised, like GameServer.submit would
+        """
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def message(self, uid, nick, text, channel=None, admin=False):
+        """
+        route a line to the worker that owns the game it's for, see GameServer.message
+        """
+        # chatter is dropped here rather than sent to a worker
+        route = self.router.parse(text, public=channel is not None)
+        if route is None:
+            return
+        if channel is None:
+            # the worker moves a player who's reconnected over to their new uid, then tells us. until then only a seat
+            # the worker says is empty is worth a try, see GameServer._reconnect. the listeners change all of these
+            # behind our back, so they're read under the lock too
+            with self._players_lock:
+                channel = self.players.get(uid)
+                if channel is None:
+                    old_uid = self.identities.match(uid)
+                    channel = self.players.get(old_uid) if old_uid in self.gone else None
+            if channel is None:
+                return
+            return self._send(shard_of(channel, self.num_workers), ('message', uid, nick, text, None, admin))
+
+        if channel not in self.adapters:
+            return
+        # the workers only know their own players, so only the front can tell someone's already playing elsewhere
+        if self.router.joins(route, channel):
+            with self._players_lock:
+                # a player back with a new nick or host counts too, see GameServer.join
+                playing_in = self.players.get(uid) or self.players.get(self.identities.match(uid), channel)
+                if playing_in == channel and uid not in self.players:
+                    # hold the seat until the worker says whether they got it, so a join for a game on another
+                    # worker in the meantime is turned away too
+                    self.players[uid] = channel
+                    self.identities.add(uid)
+            if playing_in != channel:
+                return self.adapters[channel].send([(uid, f"you're already playing in the game in {playing_in}.")])
+        self._send(shard_of(channel, self.num_workers), ('message', uid, nick, text, channel, admin))
+
+    def nick_change(self, uid, new_uid, new_nick):
+        """
+        see GameServer.nick_change. the worker reports the player's new uid back once it's moved them
+        """
+        with self._players_lock:
+            channel = self.players.get(uid)
+        if channel is not None:
+            self._send(shard_of(channel, self.num_workers), ('nick', uid, new_uid, new_nick))
+
+    def quit(self, uid):
+        """
+        see GameServer.quit. the worker tells us if it was one of its players
+        """
+        with self._players_lock:
+            channel = self.players.get(uid)
+        if channel is not None:
+            self._send(shard_of(channel, self.num_workers), ('quit', uid))
+
+    def _send(self, i, event):
+        with self._locks[i]:
+            self._conns[i].send(event)
+
+    def _listen(self, conn):
+        while True:
+            try:
+                event = conn.recv()
+            except (EOFError, OSError):
+                return
+            if event[0] == 'send':
+                _, channel, messages = event
+                self.adapters[channel].send(messages)
+            elif event[0] == 'gone':
+                with self._players_lock:
+                    if event[1] in self.players:
+                        self.gone.add(event[1])
+            elif event[0] == 'player':
+                _, uid, channel = event
+                with self._players_lock:
+                    if channel is None:
+                        self.gone.discard(uid)
+                        if self.players.pop(uid, None) is not None:
+                            self.identities.remove(uid)
+                    else:
+                        if uid not in self.players:
+                            self.identities.add(uid)
+                        self.players[uid] = channel
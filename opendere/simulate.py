@@ -0,0 +1,182 @@
+"""
+headless opendere games for balance runs
+
+drives the real Game, Ability and Action classes with scripted or random players, no irc involved. games run on a
+virtual clock that jumps straight to Game.phase_end once every player has had their turn, so a game takes milliseconds
+games are spread over a process pool in chunks, each chunk seeded from (seed, chunk number) so a run is reproducible
+no matter how the chunks land on the workers
+
+    python -m opendere.simulate --games 1000000 --players 4-12 --workers 8 --seed 1
+"""
+import argparse
+import json
+import os
+import random as stdlib_random
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from opendere import clock, game, roles
+
+
+CHANNEL = '#simulation'
+
+
+class RandomPolicy:
+    """
+    every living player votes for a random living player, except yanderes never vote for each other
+    subclass this, or pass any other picklable callable taking an rng, to script smarter players
+    """
+    def __init__(self, rng):
+        self.rng = rng
+
+    def __call__(self, g, user):
+        """
+        the command the user sends this phase, e.g. 'vote p3', or None to do nothing
+        """
+        candidates = [other for other in g.alive.values() if other is not user and not (user.role.is_yandere and other.role.is_yandere)]
+        if not candidates:
+            return None
+        return f"vote {self.rng.choice(candidates).nick}"
+
+
+def send(g, user, command):
+    """
+    send a command the way a player would, i.e. in the channel if it's public and privately otherwise
+    """
+    name = command.split(maxsplit=1)[0]
+    for ability in user.role.abilities:
+        if ability.name == name and g.current_phase in ability.phases:
+            if ability.command_public:
+                return g.user_action(user.uid, g.prefix + command, g.channel)
+            return g.user_action(user.uid, command)
+
+
+def play(num_players, policy, max_phases=100, seed=None):
+    """
+    play one game to the end and return it. g.winner is None if it was still going after max_phases
+    """
+    virtual_clock = clock.VirtualClock()
+    g = game.Game(CHANNEL, 'opendere', 'opendere', seed=seed, clock=virtual_clock)
+    for i in range(num_players):
+        g.join_game(f"p{i}!sim@simulation", f"p{i}")
+
+    virtual_clock.advance_to(g.phase_end)
+    g.tick()
+    while g.winner is None and g.phase < max_phases:
+        for user in list(g.alive.values()):
+            command = policy(g, user)
+            if command:
+                send(g, user, command)
+        virtual_clock.advance_to(g.phase_end)
+        g.tick()
+    return g
+
+
+def new_stats():
+    return {
+        'games': 0,
+        'draws': 0,
+        'by_role': defaultdict(Counter),
+        'by_players': defaultdict(Counter),
+        'by_yanderes': defaultdict(Counter),
+    }
+
+
+def record(stats, g):
+    """
+    add a finished game to stats. good and evil players win with their alignment, neutral players win by surviving
+    """
+    winner = g.winner
+    outcome = 'draw' if winner is None else winner.name
+    stats['games'] += 1
+    stats['draws'] += winner is None
+    stats['by_players'][len(g.users)][outcome] += 1
+    stats['by_yanderes'][sum(user.role.is_yandere for user in g.users.values())][outcome] += 1
+    for user in g.users.values():
+        alignment = user.alignment if user.alignment is not None else user.role.default_alignment
+        won = user.is_alive if alignment == roles.Alignment.neutral else alignment == winner
+        role_stats = stats['by_role'][type(user.role).__name__]
+        role_stats['games'] += 1
+        role_stats['wins'] += won
+
+
+def merge(stats, other):
+    stats['games'] += other['games']
+    stats['draws'] += other['draws']
+    for key in ['by_role', 'by_players', 'by_yanderes']:
+        for group, counts in other[key].items():
+            stats[key][group].update(counts)
+    return stats
+
+
+def simulate_chunk(seed, num_games, min_players, max_players, policy_factory=RandomPolicy, max_phases=100):
+    """
+    play num_games games in this process, each game seeded from the chunk's seed
+    """
+    rng = stdlib_random.Random(seed)
+    policy = policy_factory(rng)
+    stats = new_stats()
+    for _ in range(num_games):
+        record(stats, play(rng.randint(min_players, max_players), policy, max_phases, rng.getrandbits(32)))
+    return stats
+
+
+def run(num_games, min_players=4, max_players=12, workers=None, seed=0, chunk_size=1000, policy_factory=RandomPolicy, max_phases=100):
+    """
+    play num_games games over a pool of worker processes and return the aggregated stats
+    """
+    started = time.perf_counter()
+    chunks = [min(chunk_size, num_games - start) for start in range(0, num_games, chunk_size)]
+    stats = new_stats()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(simulate_chunk, seed * 1_000_003 + i, n, min_players, max_players, policy_factory, max_phases)
+            for i, n in enumerate(chunks)
+        ]
+        for future in futures:
+            merge(stats, future.result())
+    stats['seconds'] = time.perf_counter() - started
+    stats['games_per_second'] = stats['games'] / stats['seconds'] if stats['seconds'] else 0
+    return stats
+
+
+def summarize(stats):
+    """
+    turn raw stats into win rates, ready for json
+    """
+    def outcomes(counts):
+        games = sum(counts.values())
+        return {'games': games, **{outcome: counts[outcome] / games for outcome in ['good', 'evil', 'draw']}}
+
+    return {
+        'games': stats['games'],
+        'seconds': round(stats.get('seconds', 0), 3),
+        'games_per_second': round(stats.get('games_per_second', 0), 1),
+        'draws': stats['draws'],
+        'by_role': {
+            role: {'games': counts['games'], 'win_rate': counts['wins'] / counts['games']}
+            for role, counts in sorted(stats['by_role'].items())
+        },
+        'by_players': {n: outcomes(counts) for n, counts in sorted(stats['by_players'].items())},
+        'by_yanderes': {n: outcomes(counts) for n, counts in sorted(stats['by_yanderes'].items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--players', default='4-12', help='lobby size, or an inclusive range of them, e.g. 4-12')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--max-phases', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    min_players, _, max_players = args.players.partition('-')
+    stats = run(args.games, int(min_players), int(max_players or min_players), args.workers, args.seed, args.chunk_size, max_phases=args.max_phases)
+    print(json.dumps(summarize(stats), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+compact snapshots of running games, so they survive the bot restarting
+
+a snapshot is plain json: users with their roles as role class names, the votes of every ballot, the queued phase
+actions and how long the phase has left. nothing is pickled, so snapshots stay small, fast to load and readable
+"""
+import json
+import logging
+import os
+from urllib.parse import quote
+
+from opendere import action, game, roles
+
+
+role_classes = {role.__name__: role for role in roles.all_role_classes}
+action_classes = {action_type.__name__: action_type for action_type in action.action_priority}
+
+log = logging.getLogger(__name__)
+
+VERSION = 2
+
+
+def _uid(user):
+    return None if user is None else user.uid
+
+
+def dump(g):
+    """
+    the game as json-friendly lists and dicts
+    """
+    return {
+        'v': VERSION,
+        'game': [g.channel, g.bot, g.name, g.prefix, g.allow_late, g.seed, g.rng.name],
+        'phase': g.phase,
+        'time_left': None if g.phase_end is None else g.time_left,
+        'users': [
+            [
+                user.uid, user.nick, user.role and type(user.role).__name__, user.role and user.role.appear_as,
+                user.alignment and user.alignment.value, user.is_alive, user.is_hidden,
+                user.role and user.role.uses and [[user.role.abilities.index(a), left] for a, left in user.role.uses.items()]
+            ]
+            for user in g.users.values()
+        ],
+        'hurries': list(g.hurries),
+        'ballots': [
+            [command_public, phase and phase.value, [[voter.uid, _uid(target)] for voter, target in ballot.items()]]
+            for (command_public, phase), ballot in g.ballots.items()
+        ],
+        'actions': [
+            [type(a).__name__, _uid(a.user), _uid(a.target_user), *(
+                [a.ballot.cohort[0], a.ballot.cohort[1] and a.ballot.cohort[1].value] if isinstance(a, action.VoteToKillAction) else []
+            )]
+            for a in g.phase_actions
+        ],
+    }
+
+
+def _v1_to_v2(data):
+    # limited uses weren't kept track of before v2, so nobody had used any up
+    return {**data, 'v': 2, 'users': [[*user, None] for user in data['users']]}
+
+
+# version: how to turn a snapshot of that version into one of the next
+_migrations = {1: _v1_to_v2}
+
+
+def load(data, **game_kwargs):
+    """
+    rebuild a game from dump(), or from an older version of it. game_kwargs go to Game, e.g. the frontend's scheduler
+    the game's rng is started afresh from its seed, so its draws won't match what the original game would have drawn
+    """
+    while data['v'] in _migrations:
+        data = _migrations[data['v']](data)
+    if data['v'] != VERSION:
+        raise ValueError(f"unsupported snapshot version {data['v']}")
+
+    channel, bot, name, prefix, allow_late, seed, rng_backend = data['game']
+    g = game.Game(channel, bot, name, prefix, allow_late, seed=seed, rng_backend=rng_backend, **game_kwargs)
+
+    for uid, nick, role, appear_as, alignment, is_alive, is_hidden, uses in data['users']:
+        user = g._add_user(game.User(uid, nick))
+        if role is not None:
+            user.role = role_classes[role](g.rng)
+            user.role.appear_as = appear_as
+            if uses:
+                user.role.uses = {user.role.abilities[i]: left for i, left in uses}
+        if alignment is not None:
+            user.alignment = roles.Alignment(alignment)
+        user.is_alive = is_alive
+        user.is_hidden = is_hidden
+
+    def cohort(command_public, phase):
+        return command_public, None if phase is None else roles.Phase(phase)
+
+    def user(uid):
+        return None if uid is None else g.users[uid]
+
+    g.phase = data['phase']
+    g.hurries = list(data['hurries'])
+    for action_type, uid, target_uid, *vote_cohort in data['actions']:
+        if vote_cohort:
+            g.phase_actions.append(action_classes[action_type](g, user(uid), user(target_uid), g.ballot(*cohort(*vote_cohort))))
+        else:
+            g.phase_actions.append(action_classes[action_type](g, user(uid), user(target_uid)))
+
+    # queueing the votes above voted for them, but the ballots have to match the original's exactly, order included
+    for command_public, phase, votes in data['ballots']:
+        ballot = g.ballot(*cohort(command_public, phase))
+        for voter in list(ballot):
+            ballot.unvote(voter)
+        for uid, target_uid in votes:
+            ballot.vote(g.users[uid], user(target_uid))
+
+    if data['time_left'] is not None:
+        g.phase_end = g.now + data['time_left']
+    return g
+
+
+class SnapshotStore:
+    """
+    one snapshot file per channel in a directory, rewritten whenever that game changes phase
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, channel):
+        return os.path.join(self.directory, quote(channel, safe='') + '.json')
+
+    def save(self, g):
+        path = self._path(g.channel)
+        # write then rename, so a crash mid-write never leaves half a snapshot behind
+        with open(path + '.tmp', 'w') as f:
+            json.dump(dump(g), f, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+
+    def delete(self, channel):
+        try:
+            os.remove(self._path(channel))
+        except FileNotFoundError:
+            pass
+
+    def load_all(self, **game_kwargs):
+        """
+        every saved game, skipping snapshots that can't be restored
+        """
+        games = []
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    games.append(load(json.load(f), **game_kwargs))
+            except (ValueError, KeyError, TypeError):
+                log.exception(f"couldn't restore the snapshot {filename}, skipping it")
+                continue
+        return games
@@ -0,0 +1,113 @@
+class VoteLedger:
+    """
+    the votes of a single voting cohort, see VoteKillAbility, kept as running per-target counts so the current
+    standings and leader are known after every vote instead of being recounted from scratch
+
+    it reads like the old Game.votes dict, i.e. voter (User) -> target (User, or None for abstaining)
+    cohort (Tuple[bool, Phase]): the (command_public, phase) cohort voting on this ballot
+    first_vote_breaks_ties (bool): on a tie, the first voter to pick someone (i.e. not abstain) wins. used at night
+    """
+    def __init__(self, cohort=None, first_vote_breaks_ties=False):
+        self.cohort = cohort
+        self.first_vote_breaks_ties = first_vote_breaks_ties
+        self._votes = {}
+        self.counts = {}  # target -> number of votes, abstaining is counted under None
+        self._by_count = {}  # number of votes -> targets with exactly that many, so the leaders are always at hand
+        self.top_count = 0
+
+    def __len__(self):
+        return len(self._votes)
+
+    def __contains__(self, voter):
+        return voter in self._votes
+
+    def __getitem__(self, voter):
+        return self._votes[voter]
+
+    def __iter__(self):
+        return iter(self._votes)
+
+    def get(self, voter, default=None):
+        return self._votes.get(voter, default)
+
+    def items(self):
+        return self._votes.items()
+
+    def values(self):
+        return self._votes.values()
+
+    @property
+    def abstained(self) -> int:
+        return self.counts.get(None, 0)
+
+    @property
+    def leaders(self):
+        """
+        the targets tied for the most votes, None among them meaning abstain
+        """
+        return list(self._by_count.get(self.top_count, ()))
+
+    def top(self, n):
+        """
+        the n targets with the most votes as (target, count), most first, leaving out abstaining
+        there are only ever a few distinct counts (at most sqrt(2 * voters)), so this doesn't grow with the ballot
+        """
+        top = []
+        for count in sorted(self._by_count, reverse=True):
+            for target in self._by_count[count]:
+                if target is not None:
+                    top.append((target, count))
+                    if len(top) == n:
+                        return top
+        return top
+
+    def vote(self, voter, target):
+        """
+        record voter's vote for target, or for abstaining if target is None, replacing any previous vote
+        """
+        if voter in self._votes:
+            self.unvote(voter)
+        self._votes[voter] = target
+        self._move(target, 1)
+
+    def unvote(self, voter):
+        """
+        make voter undecided again, returns who they were voting for
+        """
+        target = self._votes.pop(voter)
+        self._move(target, -1)
+        return target
+
+    def tally(self):
+        """
+        who gets killed: whoever has the most votes, or None if abstaining wins, nobody voted, or there's a tie.
+        with first_vote_breaks_ties, a tie goes to whichever of the tied targets was voted for first
+        """
+        leaders = self._by_count.get(self.top_count)
+        if not leaders:
+            return None
+        elif len(leaders) == 1:
+            return next(iter(leaders))
+        elif self.first_vote_breaks_ties:
+            # the earliest vote for one of the tied leaders, not just the earliest vote
+            return next((target for target in self._votes.values() if target is not None and target in leaders), None)
+        return None
+
+    def _move(self, target, delta):
+        count = self.counts.get(target, 0)
+        if count:
+            del self._by_count[count][target]
+            if not self._by_count[count]:
+                del self._by_count[count]
+        count += delta
+        if count:
+            self.counts[target] = count
+            self._by_count.setdefault(count, {})[target] = None
+        else:
+            del self.counts[target]
+
+        # counts only ever move by one, so the top either follows this target up or drops by one when it empties
+        if count > self.top_count:
+            self.top_count = count
+        elif self.top_count not in self._by_count:
+            self.top_count = max(self.top_count - 1, 0)
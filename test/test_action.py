@@ -36,3 +36,41 @@ def test_hide_vote_kill():
 
     assert users[1].is_alive
     assert g.phase_actions == []
+
+
+def test_queue_pops_by_priority_then_entry():
+    g = game.Game(None, None, None)
+    users = [game.User(str(i), str(i)) for i in range(4)]
+    kill0 = action.KillAction(g, users[0], users[3])
+    hide = action.HideAction(g, users[1], None)
+    kill1 = action.KillAction(g, users[2], users[1])
+    vote = action.VoteToKillAction(g, users[3], users[2])
+
+    queue = action.ActionQueue([kill0, hide, kill1, vote])
+
+    assert len(queue) == 4
+    assert list(queue) == [vote, hide, kill0, kill1]
+    queue.remove_targeting(action.KillAction, users[1])
+    assert [queue.popleft() for _ in range(len(queue))] == [vote, hide, kill0]
+    assert not queue
+
+
+def test_queue_dedups_by_type_user_target_and_phase():
+    g = game.Game(None, None, None)
+    users = [game.User(str(i), str(i)) for i in range(3)]
+    queue = action.ActionQueue()
+
+    assert queue.append(action.GuardAction(g, users[0], users[1]))
+    assert not queue.append(action.GuardAction(g, users[0], users[1]))
+    assert action.GuardAction(g, users[0], users[1]) in queue
+    assert queue.is_targeted(action.GuardAction, users[1])
+    assert not queue.is_targeted(action.GuardAction, users[2])
+
+    g.phase = 1
+    assert queue.append(action.GuardAction(g, users[0], users[1]))
+    assert queue.append(action.KillAction(g, users[0], users[1]))
+    assert not queue.is_targeted(action.Action, users[0])
+    queue.append(action.UnstoppableKillAction(g, users[1], users[0]))
+    assert queue.is_targeted(action.Action, users[0])
+    assert not queue.is_targeted(action.KillAction, users[0])
+    assert len(queue) == 4
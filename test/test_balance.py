@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from opendere import balance, game, roles
+
+
+def test_categories():
+    assert balance.category(roles.Hikikomori) == balance.HIDER
+    assert balance.category(roles.Guardian) == balance.GUARD
+    # one use only, so they count as plain
+    assert balance.category(roles.Tokokyohi) == balance.PLAIN
+    assert balance.category(roles.Nurse) == balance.PLAIN
+    assert balance.category(roles.YandereSpy) == balance.UNSAFE_YANDERE
+    assert balance.category(roles.CloakedYandere) == balance.SAFE_YANDERE
+
+
+def test_worked_examples():
+    # 4 players, day first. lynch the yandere 1 in 4, otherwise they kill the last plain player that night
+    assert balance.good_wins(False, 1, 0, 3, 0, 0) == pytest.approx(1 / 4)
+    # ...unless a plain player was lynched and the yandere picks the hider, then there's one more lynch out of 3
+    assert balance.good_wins(False, 1, 0, 2, 1, 0) == pytest.approx(1 / 4 + 2 / 4 * 1 / 2 * 1 / 3)
+    # or the guard is the one guarding the plain player the yandere picks. it dies guarding an unsafe yandere
+    # instead, but then the plain player dies too, so it works out the same
+    assert balance.good_wins(False, 1, 0, 2, 0, 1) == pytest.approx(7 / 24)
+    assert balance.good_wins(False, 0, 1, 2, 0, 1) == pytest.approx(7 / 24)
+
+
+def test_compositions_cover_every_deal():
+    for n in [4, 12, 13, 30]:
+        deals = list(balance.compositions(n))
+        assert sum(chance for _, chance in deals) == pytest.approx(1)
+        for composition, _ in deals:
+            assert sum(composition) == n
+            assert composition[balance.SAFE_YANDERE] + composition[balance.UNSAFE_YANDERE] == game.Game.num_yanderes(n)
+
+
+def test_table_is_cached(tmp_path, monkeypatch):
+    cache = str(tmp_path / 'balance.json')
+    lobbies = balance.table(4, 6, cache)
+    assert list(lobbies) == [4, 5, 6]
+    assert 0 < lobbies[4]['good'] < 1
+    assert lobbies[4]['good'] + lobbies[4]['evil'] == pytest.approx(1)
+    with open(cache) as f:
+        assert set(json.load(f)['lobbies']) == {'4', '5', '6'}
+
+    def evaluate(n):
+        raise AssertionError(f"{n} players should have come from the cache")
+    monkeypatch.setattr(balance, 'evaluate', evaluate)
+    assert balance.table(4, 6, cache) == lobbies
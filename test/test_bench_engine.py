@@ -0,0 +1,16 @@
+import importlib.util
+import os
+
+spec = importlib.util.spec_from_file_location('bench_engine', os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'bench_engine.py'))
+bench_engine = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bench_engine)
+
+
+def test_benchmarks_run_and_compare():
+    results = bench_engine.run_all([5], repeat=1)
+    assert set(results['results']) == set(bench_engine.benchmarks)
+    assert results['results']['join_game']['5']['ops'] == 5
+
+    assert bench_engine.compare(results, results, 1.25) == []
+    slower = {'results': {'join_game': {'5': {**results['results']['join_game']['5'], 'us_per_op_median': results['results']['join_game']['5']['us_per_op_median'] * 2}}}}
+    assert bench_engine.compare(results, slower, 1.25) == [('join_game', '5', 2.0)]
@@ -0,0 +1,11 @@
+import importlib.util
+import os
+
+spec = importlib.util.spec_from_file_location('bench_router', os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'bench_router.py'))
+bench_router = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bench_router)
+
+
+def test_router_benchmark_runs():
+    results = bench_router.run(num_lines=200)
+    assert set(results['ns_per_line']) == {'legacy', 'pattern', 'parse', 'server'}
@@ -1,35 +1,37 @@
 import pytest
-from freezegun import freeze_time
-from opendere import game
+from opendere import clock, game, roles
 
 
 def test_create_game_too_few():
-    g = game.Game(None, None, None)
+    c = clock.VirtualClock()
+    g = game.Game(None, None, None, clock=c)
     for i in range(3):
         g.join_game(str(i), str(i))
 
     assert len(g.users) == 3
-    with freeze_time(g.phase_end):
-        with pytest.raises(ValueError):
-            g.tick()
+    c.advance_to(g.phase_end)
+    with pytest.raises(ValueError):
+        g.tick()
 
 
 def test_create_game_success():
-    g = game.Game(None, None, None)
+    c = clock.VirtualClock()
+    g = game.Game(None, None, None, clock=c)
     for i in range(4):
         g.join_game(str(i), str(i))
 
     assert len(g.users) == 4
     assert g.phase == None
-    with freeze_time(g.phase_end):
-        g.tick()
+    c.advance_to(g.phase_end)
+    g.tick()
     assert g.phase == 0
     assert g.phase_name == 'day'
     assert g.num_yanderes_alive == 1
 
 
 def test_create_night_game_success():
-    g = game.Game(None, None, None)
+    c = clock.VirtualClock()
+    g = game.Game(None, None, None, clock=c)
     for i in range(7):
         g.join_game(str(i), str(i))
 
@@ -38,8 +40,194 @@ def test_create_night_game_success():
 
     assert len(g.users) == 7
     assert g.phase == None
-    with freeze_time(g.phase_end):
-        g.tick()
+    c.advance_to(g.phase_end)
+    g.tick()
     assert g.phase == 0
     assert g.phase_name == 'night'
     assert g.num_yanderes_alive == 2
+
+
+def test_get_user_by_nick_and_prefix():
+    g = game.Game(None, None, None)
+    for nick in ['kitties', 'KitKat', 'doggo']:
+        g.join_game(f"{nick}!user@host", nick)
+
+    assert g.get_user('kitkat').uid == 'KitKat!user@host'
+    assert g.get_user('doggo!user@host').nick == 'doggo'
+    assert g.get_user('dog') is None
+    assert g.get_user('dog', prefix=True).nick == 'doggo'
+    # ambiguous until one of them dies
+    assert g.get_user('kit', prefix=True) is None
+    g.get_user('kitkat').is_alive = False
+    assert g.get_user('kit', prefix=True).nick == 'kitties'
+    assert g.get_user('kitkat') is None
+
+
+def test_liveness_counters_follow_deaths_and_roles():
+    c = clock.VirtualClock()
+    g = game.Game(None, None, None, clock=c)
+    for i in range(7):
+        g.join_game(str(i), str(i))
+    c.advance_to(g.phase_end)
+    g.tick()
+
+    yanderes = [user for user in g.users.values() if user.role.is_yandere]
+    assert g.num_players_alive == 7
+    assert g.num_yanderes_alive == len(yanderes) == 2
+
+    yanderes[0].is_alive = False
+    assert g.num_players_alive == 6
+    assert g.num_yanderes_alive == 1
+    assert list(g.dead.values()) == [yanderes[0]]
+
+    yanderes[1].role = roles.Trap()
+    assert g.num_yanderes_alive == 1
+    assert g.num_yandere_killers == 0
+
+
+def test_user_action_dispatch_and_help():
+    c = clock.VirtualClock()
+    g = game.Game('#opendere', 'bot', 'opendere', clock=c)
+    for i in range(4):
+        g.join_game(str(i), f"player{i}")
+    c.advance_to(g.phase_end)
+    g.tick()
+
+    assert g.user_action('0', '!dance', '#opendere') is None
+    assert g.user_action('0', '!vote', '#opendere') == [('0', 'usage: vote <user>')]
+    assert g.user_action('0', 'vote player1') == [('0', 'please enter that command in #opendere instead.')]
+    assert g.user_action('0', '!v player1', '#opendere')[0][1].startswith('player0 has voted for player1.')
+    assert '!vote <user> in #opendere' in g.user_action('0', 'help')[0][1]
+
+    # abstaining is only for votes, anything else is looked up as a player, and no use is spent on it
+    ronin = g.users['2']
+    ronin.role = roles.Ronin()
+    assert g.user_action('2', 'kill a') == [('2', "invalid target 'a' for command kill. please try again.")]
+    assert ronin.role.uses_left(ronin.role.abilities[0]) == 1
+
+    # spying has no action behind it yet, so it's left out of help and answered instead of raising
+    g.users['1'].role = roles.DaySpy()
+    assert g.current_phase == roles.Phase.day
+    assert 'spy' not in g.user_action('1', 'help')[0][1]
+    assert g.user_action('1', 'spy player0')[0][1].startswith("the spy ability isn't in the game yet")
+
+
+def test_clock_is_read_once_per_event():
+    c = clock.VirtualClock(100)
+    g = game.Game('#opendere', 'bot', 'opendere', clock=c)
+    assert g.join_game('0', 'player0')[0] == ('#opendere', "an opendere game is starting in #opendere in 60 seconds! please type !opendere to join!")
+    assert g.phase_end == 160
+
+    c.advance(50)
+    assert g.time_left == 10
+    assert g.tick() is None
+    g.user_extend('0')
+    assert g.phase_end == 190
+
+
+def test_large_lobby_summaries():
+    c = clock.VirtualClock()
+    g = game.Game('#opendere', 'bot', 'opendere', clock=c)
+    for i in range(100):
+        g.join_game(str(i), f"player{i:03}")
+    c.advance_to(g.phase_end)
+    messages = g.tick()
+
+    assert g.num_yanderes_alive == 9 + (100 - 30) // 6
+    assert messages[-1][1].startswith('100 players are still alive (0 dead), see !players for who.')
+    assert g.phase_end - c.now() == g.phase_length > 300
+    assert g.user_players('0') == [('0', f"players alive (1/3): {', '.join(f'player{i:03}' for i in range(40))}")]
+    assert g.user_players('0', 9)[0][1].startswith('players alive (3/3): player080, ')
+
+    for i in range(10):
+        g.user_action(str(i), f"!vote player{i % 7 + 90:03}", '#opendere')
+    assert g.list_votes == 'top votes are: player090: 2, player091: 2, player092: 2, player093: 1, player094: 1, 2 others, abstained: 0, undecided: 90'
+
+
+def test_reissuing_a_queued_action():
+    c = clock.VirtualClock()
+    g = game.Game('#opendere', 'bot', 'opendere', clock=c)
+    for i in range(4):
+        g.join_game(str(i), f"player{i}")
+    c.advance_to(g.phase_end)
+    g.tick()
+    user = g.users['0']
+    user.role = roles.Hikikomori(g.rng)
+    c.advance_to(g.phase_end)
+    g.tick()
+    assert g.phase_name == 'night'
+
+    assert g.user_action('0', 'hide') == []
+    assert g.user_action('0', 'hide') == [('0', "you're already doing that this night.")]
+    assert len(g.phase_actions) == 1
+
+
+def test_identity_index_matches_any_two_parts():
+    identities = game.IdentityIndex()
+    identities.add('kitties!meow@home')
+    identities.add('doggo!woof@home')
+    assert identities.match('kitties!meow@home') == 'kitties!meow@home'
+    assert identities.match('kitties_!meow@home') == 'kitties!meow@home'  # new nick
+    assert identities.match('Kitties!meow@phone') == 'kitties!meow@home'  # new host
+    assert identities.match('kitties!purr@home') == 'kitties!meow@home'  # new user
+    assert identities.match('kitties!purr@phone') is None
+    # both are @home, so a third nick!user there can't be told apart
+    identities.add('birb!meow@home')
+    assert identities.match('someone!meow@home') is None
+    identities.remove('birb!meow@home')
+    assert identities.match('someone!meow@home') == 'kitties!meow@home'
+    # discord's ids and the like aren't hostmasks, so there's nothing to match them on
+    identities.add('1234')
+    assert identities.match('1234') is None
+    assert len(identities) == 2
+
+
+def test_nick_change_keeps_votes_and_actions():
+    c = clock.VirtualClock()
+    g = game.Game('#opendere', 'bot', 'opendere', clock=c)
+    for i in range(4):
+        g.join_game(f"player{i}!user{i}@host", f"player{i}")
+    c.advance_to(g.phase_end)
+    g.tick()
+    g.user_action('player0!user0@host', '!vote player1', '#opendere')
+    g.user_action('player2!user2@host', '!vote player1', '#opendere')
+    g.user_hurry('player1!user1@host')
+
+    assert g._nick_change('player1!user1@host', 'kitties!user1@host', 'player1', 'kitties') == []
+    user = g.users['kitties!user1@host']
+    assert 'player1!user1@host' not in g.users and g.alive['kitties!user1@host'] is user
+    assert g.get_user('kitties') is user and g.get_user('player1') is None
+    assert g.identities.match('kitties!user1@phone') == 'kitties!user1@host'
+    assert g.hurries == ['kitties!user1@host']
+    assert g.votes[g.users['player0!user0@host']] is user
+    assert g.list_votes == 'current votes are: kitties: 2, abstained: 0, undecided: 2'
+    assert g._nick_change('nobody!user@host', 'somebody!user@host', 'nobody', 'somebody') is None
+    # can't take over someone else's uid
+    assert g._nick_change('kitties!user1@host', 'player0!user0@host', 'kitties', 'player0') is None
+
+    c.advance_to(g.phase_end)
+    messages = g.tick()
+    assert not user.is_alive and 'kitties!user1@host' in g.dead
+    assert any('you lynch kitties' in text for _, text in messages)
+
+
+def test_yanderes_only_scale_down_in_large_lobbies():
+    assert [game.Game.num_yanderes(n) for n in [4, 7, 12, 18, 24, 29]] == [1, 2, 3, 5, 7, 9]
+    # a large lobby carries on from there, one more for every 6 players
+    assert game.Game.large_lobby == 30
+    assert [game.Game.num_yanderes(n) for n in [30, 35, 36, 42]] == [9, 9, 10, 11]
+
+
+def test_nicks_that_only_differ_by_case_dont_shadow_each_other():
+    g = game.Game('#opendere', 'bot', 'opendere')
+    for uid, nick in [('1', 'Kitties'), ('2', 'kitties'), ('3', 'puppies')]:
+        g.join_game(uid, nick)
+
+    assert len(g.nicks) == 3
+    # the exact nick tells them apart, anything else is ambiguous rather than whoever joined last
+    assert g.get_user('Kitties').uid == '1' and g.get_user('kitties').uid == '2'
+    assert g.get_user('KITTIES', prefix=True) is None and g.get_user('kit', prefix=True) is None
+    assert [user.uid for user in g.nicks.page(0, 3)] == ['1', '2', '3']
+
+    g.nicks.remove(g.users['2'])
+    assert g.get_user('KITTIES').uid == '1' and g.get_user('kit', prefix=True).uid == '1'
@@ -0,0 +1,48 @@
+import os
+
+from opendere import game, journal
+
+
+def state(g):
+    return (
+        g.phase,
+        [(u.uid, type(u.role), u.role.appear_as, u.is_alive) for u in g.users.values()],
+        {cohort: {voter.uid: target and target.uid for voter, target in ballot.items()} for cohort, ballot in g.ballots.items()},
+        [(type(a), a.user.uid, a.target_user and a.target_user.uid) for a in g.phase_actions],
+    )
+
+
+def test_replay_rebuilds_the_same_game(tmp_path):
+    path = tmp_path / 'game.jsonl'
+    g = game.Game('#opendere', 'bot', 'opendere', journal=journal.Journal(path, buffer_size=4))
+    for i in range(6):
+        g.join_game(f"{i}!user@host", f"player{i}")
+    g.user_hurry('0!user@host')
+    g._phase_change()
+    for i in range(5):
+        g.user_action(f"{i}!user@host", f"!vote player{(i + 1) % 3}", '#opendere')
+    g._nick_change('1!user@host', '1!user@elsewhere', 'player1', 'kitties')
+    g._phase_change()
+    g.user_action('5!user@host', '!vote a', '#opendere')
+    g.journal.flush()
+
+    events = journal.read(path)
+    assert events[0][0] == 'game' and events[0][-2] == g.seed
+    messages = []
+    replayed = journal.replay(events, messages)
+    assert state(replayed) == state(g)
+    assert messages
+
+
+def test_replay_of_a_reset_game():
+    events = [['game', 0, '#opendere', 'bot', 'opendere', '!', False, 1, 'stdlib'], ['join', 0.1, 'a', 'a'], ['reset', 1]]
+    assert journal.replay(events) is None
+
+
+def test_new_paths_never_collide(tmp_path):
+    directory = tmp_path / 'journals'
+    paths = [journal.new_path(str(directory), '#open/dere') for _ in range(3)]
+
+    # the directory is made, the channel can't reach outside it, and games started in the same second get a file each
+    assert len(set(paths)) == 3
+    assert all(os.path.dirname(path) == str(directory) and '%23open%2Fdere' in path for path in paths)
@@ -0,0 +1,62 @@
+import asyncio
+
+from opendere import metrics, server
+
+
+def test_histograms_render_as_prometheus_text():
+    r = metrics.Registry()
+    r.observe('opendere_command_seconds', 0.0002, command='vote')
+    r.observe('opendere_command_seconds', 0.02, command='vote')
+    r.observe('opendere_phase_actions_queued', 7)
+    r.inc('opendere_messages_total', 3, kind='channel')
+
+    text = r.render()
+    assert '# TYPE opendere_command_seconds histogram' in text
+    assert 'opendere_command_seconds_bucket{command="vote",le="0.0005"} 1' in text
+    assert 'opendere_command_seconds_bucket{command="vote",le="+Inf"} 2' in text
+    assert 'opendere_command_seconds_count{command="vote"} 2' in text
+    assert 'opendere_phase_actions_queued_bucket{le="10"} 1' in text
+    assert 'opendere_messages_total{kind="channel"} 3' in text
+    assert r.histograms[('opendere_command_seconds', (('command', 'vote'),))].quantile(0.5) == 0.0005
+
+
+def test_server_records_commands_and_answers_admins():
+    r = metrics.Registry()
+
+    async def run():
+        s = server.GameServer(admins=['*!*@Staff.example.org'], metrics=r)
+        local = server.LocalAdapter(s, ['#a'])
+        for i in range(4):
+            local.say(f"p{i}", f"p{i}", '!opendere', '#a')
+        s.games['#a']._phase_change()
+        local.say('p0', 'p0', '!sneeze', '#a')
+        local.say('p0', 'p0', '!stats', '#a')
+        # aliases are counted under the command's own name
+        local.say('p0', 'p0', '!h', '#a')
+        local.say('p1', 'p1', '!hurry', '#a')
+        # the nick alone doesn't make an admin
+        local.say('boss!b@elsewhere', 'boss', '!stats', '#a')
+        local.say('boss!b@staff.example.org', 'boss', '!stats', '#a')
+        # and a frontend can vouch for someone itself
+        s.message('owner!o@home', 'owner', '!stats', '#a', admin=True)
+        return local.sent
+
+    sent = asyncio.run(run())
+    boss = [text for recipient, text in sent if recipient == 'boss!b@staff.example.org']
+    assert any('command[join]: n=4' in text for text in boss) and any('command[hurry]: n=2' in text for text in boss)
+    assert sent[-1][0] == 'owner!o@home'
+    assert not any(recipient in ('p0', 'boss!b@elsewhere') and 'command' in text for recipient, text in sent)
+    # chatter is dropped by the router before anything is recorded
+    assert [labels for name, labels in r.histograms if name == 'opendere_command_seconds'] == [(('command', 'join'),), (('command', 'stats'),), (('command', 'hurry'),)]
+    assert r.counters[('opendere_messages_total', (('kind', 'private'),))] >= 4
+
+
+def test_summary_lines_fit():
+    r = metrics.Registry()
+    for i in range(50):
+        r.inc('opendere_sent_total', kind=f"kind{i}")
+    lines = r.summary(max_length=100)
+
+    assert len(lines) > 1 and all(len(line) <= 100 for line in lines)
+    assert '; '.join(lines).count('sent_total') == 50
+    assert metrics.Registry().summary() == ['nothing recorded yet.']
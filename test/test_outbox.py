@@ -0,0 +1,44 @@
+from opendere import outbox
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_channel_first_and_coalesced():
+    o = outbox.Outbox(['#opendere'], clock=FakeClock())
+    o.put([('a!a@a', 'you are a yandere.'), ('#opendere', 'day 1 has begun.'), ('a!a@a', 'kill someone.'), ('#opendere', 'vote now.')])
+    assert len(o) == 4
+    assert o.pop() == ('#opendere', 'day 1 has begun. | vote now.', True)
+    assert o.pop() == ('a!a@a', 'you are a yandere. | kill someone.', False)
+    assert o.pop() is None
+    assert len(o) == 0
+
+
+def test_long_lines_are_not_merged():
+    o = outbox.Outbox([], max_length=10, clock=FakeClock())
+    o.put([('a', 'x' * 8), ('a', 'y' * 8)])
+    assert o.pop() == ('a', 'x' * 8, False)
+    assert o.pop() == ('a', 'y' * 8, False)
+
+
+def test_token_bucket_paces_sends():
+    clock = FakeClock()
+    o = outbox.Outbox([], rate=2.0, burst=3, clock=clock)
+    o.put([(str(i), 'hi') for i in range(10)])
+    assert [o.pop()[0] for _ in range(3)] == ['0', '1', '2']
+    assert o.pop() is None
+
+    clock.now += 0.5
+    assert o.pop()[0] == '3'
+    assert o.pop() is None
+
+    # the bucket never holds more than the burst, however long it's been quiet
+    clock.now += 100
+    assert [o.pop()[0] for _ in range(3)] == ['4', '5', '6']
+    assert o.pop() is None
+    assert o.sent == 7
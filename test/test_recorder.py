@@ -0,0 +1,90 @@
+import json
+import time
+
+from opendere import action, clock, game, recorder, roles
+
+
+def new_game(r, num_players=4):
+    c = clock.VirtualClock()
+    g = game.Game('#opendere', 'bot', 'opendere', clock=c, recorder=r)
+    for i in range(num_players):
+        g.join_game(str(i), f"player{i}")
+    c.advance_to(g.phase_end)
+    g.tick()
+    return g, c
+
+
+def test_fast_phase_changes_leave_nothing(tmp_path):
+    r = recorder.Recorder(str(tmp_path), budget=10)
+    g, c = new_game(r)
+    c.advance_to(g.phase_end)
+    g.tick()
+    g._process_phase_actions()
+    r.close()
+
+    assert g.phase == 1
+    assert not r.dumps
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_slow_phase_change_is_captured(tmp_path):
+    r = recorder.Recorder(str(tmp_path), budget=0.02, interval=0.001)
+    g, c = new_game(r)
+    g.user_action('0', '!vote player1', '#opendere')
+    g.user_action('2', '!vote player1', '#opendere')
+
+    tally_votes = g.tally_votes
+    def slow_tally_votes():
+        time.sleep(0.1)
+        return tally_votes()
+    g.tally_votes = slow_tally_votes
+    c.advance_to(g.phase_end)
+    messages = g.tick()
+    r.close()
+
+    assert len(r.dumps) == 1
+    with open(r.dumps[0]) as f:
+        capture = json.load(f)
+    assert capture['call'] == '_phase_change'
+    assert capture['phase'] == 0
+    assert capture['seconds'] > 0.02
+    assert capture['ballots'] == [[True, 'day', {'player0': 'player1', 'player2': 'player1'}]]
+    assert capture['messages'] == [list(message) for message in messages]
+    # the samples only start once the call is over budget, i.e. while it's sleeping
+    assert capture['samples']
+    assert all('slow_tally_votes' in stack for stack, _ in capture['samples'])
+
+
+def test_slow_actions_are_captured(tmp_path, monkeypatch):
+    r = recorder.Recorder(str(tmp_path), budget=0.02, interval=0.001)
+    g, c = new_game(r)
+    g.users['0'].role = roles.Hikikomori(g.rng)
+    c.advance_to(g.phase_end)
+    g.tick()
+    g.user_action('0', 'hide')
+
+    def slow_hide(self):
+        time.sleep(0.05)
+        return []
+    monkeypatch.setattr(action.HideAction, '__call__', slow_hide)
+    g._process_phase_actions()
+    r.close()
+
+    with open(r.dumps[0]) as f:
+        capture = json.load(f)
+    assert capture['call'] == '_process_phase_actions'
+    assert capture['phase_actions'] == [['HideAction', 'player0', None]]
+    assert g.metrics.counters[('opendere_slow_calls_total', (('call', '_process_phase_actions'),))] >= 1
+
+
+def test_captures_in_the_same_second_are_all_kept(tmp_path):
+    r = recorder.Recorder(str(tmp_path), max_dumps=2)
+    g, c = new_game(r)
+    r.budget = 0
+    for _ in range(3):
+        r.watch(g, '_phase_change', lambda: [])
+    r.close()
+
+    # every capture has a file of its own, but only the latest are remembered
+    assert len(list(tmp_path.iterdir())) == 3
+    assert len(r.dumps) == 2
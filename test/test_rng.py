@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+from opendere import game, rng
+
+# cumulative `python -X importtime` budget for opendere.game, in microseconds. it was ~100ms while numpy was
+# imported up front and is ~30ms without it
+IMPORT_BUDGET_US = 75_000
+
+
+def test_import_stays_within_budget_without_numpy():
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import sys, opendere.game; print("numpy" in sys.modules)'],
+        capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == 'False'
+    cumulative = next(int(line.split('|')[1]) for line in result.stderr.splitlines() if line.endswith('| opendere.game'))
+    assert cumulative < IMPORT_BUDGET_US
+
+
+def test_same_seed_same_game():
+    dealt = []
+    for _ in range(2):
+        g = game.Game(None, None, None, seed=42)
+        for i in range(9):
+            g.join_game(str(i), str(i))
+        g._phase_change()
+        dealt.append([(user.uid, type(user.role), user.role.appear_as) for user in g.users.values()])
+    assert dealt[0] == dealt[1]
+
+
+def test_backends_draw_alike():
+    for backend in rng.backends:
+        r = rng.new(1, backend)
+        assert 0 <= r.random() < 1
+        assert r.randrange(3) in range(3)
+        assert r.choice('abc') in 'abc'
+        assert sorted(r.alias_draws((1.0, 0.0), (0, 0), 5)) == [0] * 5
@@ -1,12 +1,16 @@
 from opendere import roles, ability
 
 
-def test_roles_dont_share_ability_objects():
-    hik0 = roles.Hikikomori()
-    hik1 = roles.Hikikomori()
-    assert len(hik0.abilities) == len(hik1.abilities)
-    hik0.abilities += ['foo']
-    assert len(hik0.abilities) != len(hik1.abilities)
+def test_roles_share_ability_tables_but_not_uses():
+    tok0 = roles.Tokokyohi()
+    tok1 = roles.Tokokyohi()
+    assert tok0.abilities is tok1.abilities is roles.Tokokyohi.abilities
+    assert not hasattr(tok0, '__dict__')
+
+    hide = tok0.abilities[0]
+    tok0.use(hide)
+    assert tok0.uses_left(hide) == 0
+    assert tok1.uses_left(hide) == 1
 
 
 def test_no_illegal_ability_configurations():
@@ -16,3 +20,11 @@ def test_no_illegal_ability_configurations():
         for role_ability in role.abilities:
             if type(role_ability) not in legal_phase_abilities and roles.Phase.day in role_ability.phases:
                 assert not role_ability.is_exclusively_phase_action, ('failed for', role, role_ability)
+
+
+def test_dispatch_tables():
+    assert roles.Yandere.commands[('vote', roles.Phase.night)] is roles.Yandere.abilities[0]
+    assert roles.Yandere.commands[('lynch', roles.Phase.day)] is roles.Yandere.abilities[1]
+    assert ('hide', roles.Phase.day) not in roles.Hikikomori.commands
+    assert roles.Hikikomori.abilities_by_phase[roles.Phase.night] == (roles.Hikikomori.abilities[0],)
+    assert {'vote', 'v', 'lynch', 'hide', 'kill', 'guard'} <= roles.all_commands
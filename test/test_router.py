@@ -0,0 +1,42 @@
+import re
+
+from opendere import router
+
+
+def test_parse_once_and_drop_chatter():
+    r = router.Router('!', ['games'])
+    assert r.parse('hello everyone') is None
+    assert r.parse('!weather london') is None
+    assert r.parse('vote kitties') is None
+    assert r.parse('vote kitties', public=False) == ('ability', 'vote', 'kitties')
+    assert r.parse('!VOTE  kitties ') == ('ability', 'vote', 'kitties')
+    assert r.parse('!hurry') == ('hurry', 'hurry', '')
+    assert r.parse('!games') == ('join', 'games', '')
+    assert r.parse('!opendere vote kitties') == ('ability', 'vote', 'kitties')
+    assert r.joins(r.parse('!games'), '#games')
+    assert not r.joins(r.parse('!games'), '#opendere')
+    assert [router.name(r.parse(line)) for line in ['!h', '!hayaku', '!v kitties', '!games']] == ['hurry', 'hurry', 'vote', 'join']
+
+    pattern = re.compile(r.pattern)
+    for line in ['!vote kitties', '!Games', '!u', '!players 2']:
+        assert pattern.match(line), line
+    for line in ['!weather', '!votes', '!uh', 'vote kitties']:
+        assert not pattern.match(line), line
+
+    # private commands can go without the prefix, which only private_pattern picks up
+    private_pattern = re.compile(r.private_pattern)
+    for line in ['vote kitties', 'Help', 'players 2']:
+        assert private_pattern.match(line) and r.parse(line, public=False), line
+    for line in ['!vote kitties', 'votes kitties', 'weather']:
+        assert not private_pattern.match(line), line
+
+
+def test_game_name_is_a_prefix_not_a_set_of_characters():
+    from opendere import game
+    g = game.Game('#spam', 'bot', 'spam')
+    for i in range(4):
+        g.join_game(str(i), f"player{i}")
+    g._phase_change()
+    # lstrip('spam') used to eat the start of commands made of those letters, e.g. 'spy' became 'y'
+    assert g.router.parse('!spam spy player1') == ('ability', 'spy', 'player1')
+    assert g.user_action('0', '!spam vote player1', '#spam')[0][1].startswith('player0 has voted for player1.')
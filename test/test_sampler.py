@@ -0,0 +1,24 @@
+from collections import Counter
+
+from opendere import rng, sampler
+
+
+def test_alias_tables_match_the_weights():
+    weights = {'a': 1, 'b': 3, 'c': 6, 'd': 0}
+    s = sampler.WeightedSampler(weights)
+
+    counts = Counter()
+    for backend in rng.backends:
+        r = rng.new(0, backend)
+        counts.update(s.sample_many(10000, r))
+        counts.update(s.sample(r) for _ in range(10000))
+
+    assert counts['d'] == 0
+    for choice in 'abc':
+        assert abs(counts[choice] / 40000 - weights[choice] / 10) < 0.02
+
+
+def test_sample_many_sizes():
+    s = sampler.WeightedSampler({'only': 1})
+    assert s.sample_many(0) == []
+    assert s.sample_many(3) == ['only'] * 3
@@ -0,0 +1,85 @@
+import threading
+
+from opendere import clock, game, scheduler
+
+
+def test_pop_due_in_deadline_order():
+    s = scheduler.Scheduler()
+    now = 1000.0
+    games = [game.Game(str(i), None, None, scheduler=s) for i in range(3)]
+    games[0].phase_end = now + 20
+    games[1].phase_end = now + 10
+    games[2].phase_end = now + 30
+
+    assert s.next_deadline() == games[1].phase_end
+    assert s.pop_due(now) == []
+    assert s.pop_due(now + 25) == [games[1], games[0]]
+    assert len(s) == 1
+
+
+def test_game_reschedules_on_join_hurry_and_reset():
+    s = scheduler.Scheduler()
+    g = game.Game(None, None, None, scheduler=s)
+    for i in range(4):
+        g.join_game(str(i), str(i))
+    assert s.next_deadline() == g.phase_end
+
+    g.user_hurry('0')
+    assert s.next_deadline() == g.phase_end
+    assert len(s) == 1
+
+    g.reset()
+    assert s.next_deadline() is None
+    assert g not in s
+
+
+def test_run_wakes_at_deadline():
+    s = scheduler.Scheduler()
+    stop = threading.Event()
+    fired = threading.Event()
+    woken = []
+
+    def callback(g):
+        woken.append(g)
+        fired.set()
+
+    g = game.Game(None, None, None, scheduler=s)
+    thread = threading.Thread(target=s.run, args=(callback, stop))
+    thread.start()
+
+    g.phase_end = clock.default.now() + 0.05
+    fired.wait(timeout=1)
+    s.stop(stop)
+    thread.join()
+
+    assert woken == [g]
+
+
+def test_run_survives_a_failing_callback():
+    s = scheduler.Scheduler()
+    s.retry_delay = 0.05
+    stop = threading.Event()
+    woken = []
+
+    def callback(g):
+        woken.append(g)
+        if len(woken) == 1:
+            raise RuntimeError('bad phase change')
+
+    c = clock.VirtualClock(1000)
+    games = [game.Game(str(i), None, None, scheduler=s, clock=c) for i in range(2)]
+    for g in games:
+        g.phase_end = 1000
+    thread = threading.Thread(target=s.run, args=(callback, stop, c), daemon=True)
+    thread.start()
+    # the second game still fires, and the first, left without a deadline, is tried again
+    while len(woken) < 2:
+        pass
+    assert woken == games
+    assert s.next_deadline() == 1000 + s.retry_delay
+    c.advance(1)
+    while len(woken) < 3:
+        pass
+    s.stop(stop)
+    thread.join()
+    assert woken == [*games, games[0]]
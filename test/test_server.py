@@ -0,0 +1,135 @@
+import asyncio
+
+from opendere import server
+
+
+async def start():
+    s = server.GameServer()
+    local = server.LocalAdapter(s, ['#a', '#b'])
+    task = asyncio.create_task(s.serve())
+    await asyncio.sleep(0)
+    return s, local, task
+
+
+def test_games_in_many_channels_start_on_the_loop():
+    async def run():
+        s, local, task = await start()
+        for channel in ['#a', '#b']:
+            for i in range(4):
+                local.say(f"{channel}{i}", f"{channel}{i}", '!opendere', channel)
+        assert set(s.games) == {'#a', '#b'}
+        assert s.players['#a0'] == '#a'
+
+        # the server is woken up by the earliest deadline, not by polling
+        s.games['#b'].phase_end = s.clock.now()
+        await asyncio.sleep(0.05)
+        assert s.games['#b'].phase == 0
+        assert s.games['#a'].phase is None
+
+        s.stop()
+        await task
+        return local.sent
+
+    sent = asyncio.run(run())
+    assert ('#a0', "you've joined the current game, which is starting in 60.0 seconds.") in sent
+    assert any(recipient == '#b' and 'current players' in text for recipient, text in sent)
+
+
+def test_async_scheduler_survives_a_failing_callback():
+    from opendere import clock
+
+    class Game:
+        channel = '#a'
+
+    games = [Game(), Game()]
+    woken = []
+
+    def callback(g):
+        woken.append(g)
+        if woken == games[:1]:
+            raise RuntimeError('boom')
+
+    async def run():
+        c = clock.VirtualClock(1000)
+        sched = server.AsyncScheduler(callback, c)
+        sched.retry_delay = 0
+        for g in games:
+            sched.schedule(g, 1000)
+        sched.start(asyncio.get_running_loop())
+        await asyncio.sleep(0.05)
+        sched.close()
+
+    asyncio.run(run())
+    # the game after the failing one still ran, and the failing one was tried again
+    assert woken == [*games, games[0]]
+
+
+def test_one_game_per_player_and_reset():
+    async def run():
+        s, local, task = await start()
+        local.say('p', 'p', '!opendere', '#a')
+        local.say('p', 'p', '!opendere', '#b')
+        assert local.sent[-1] == ('p', "you're already playing in the game in #a.")
+        assert '#b' not in s.players.values()
+
+        local.say('p', 'p', '!reset', '#a')
+        assert s.games == {} and s.players == {}
+        s.stop()
+        await task
+
+    asyncio.run(run())
+
+
+def test_players_are_followed_across_nick_changes_and_reconnects():
+    async def run():
+        s, local, task = await start()
+        for i in range(4):
+            local.say(f"p{i}!u{i}@host{i}", f"p{i}", '!opendere', '#a')
+        g = s.games['#a']
+        g._phase_change()
+
+        s.nick_change('p0!u0@host0', 'kitties!u0@host0', 'kitties')
+        assert s.players == {'kitties!u0@host0': '#a', **{f"p{i}!u{i}@host{i}": '#a' for i in range(1, 4)}}
+        assert g.users['kitties!u0@host0'].nick == 'kitties'
+
+        # someone on the same host as a player who's still connected can't take their seat, whatever they send
+        local.say('stranger!u1@host1', 'stranger', '!hurry', '#a')
+        local.say('stranger!u1@host1', 'stranger', 'help')
+        assert 'stranger!u1@host1' not in s.players and s.players['p1!u1@host1'] == '#a'
+        assert 'stranger!u1@host1' not in g.users
+
+        # once p1's connection drops, p1 comes back from a new host and carries on playing
+        s.quit('p1!u1@host1')
+        local.say('p1!u1@phone', 'p1', '!vote kitties', '#a')
+        assert 'p1!u1@host1' not in s.players and s.players['p1!u1@phone'] == '#a'
+        assert g.votes[g.users['p1!u1@phone']] is g.users['kitties!u0@host0']
+        # the server's own index follows them, so it's one lookup however many games there are
+        assert s.identities.match('p1!u1@laptop') == 'p1!u1@phone' and len(s.identities) == 4
+        # a player back from a new host can't join a second game
+        local.say('p2!u2@phone', 'p2', '!opendere', '#b')
+        assert local.sent[-1] == ('p2!u2@phone', "you're already playing in the game in #a.")
+        assert 'p2!u2@phone' not in s.players and '#b' not in s.games
+        s.stop()
+        await task
+
+    asyncio.run(run())
+
+
+def test_discord_only_treats_dms_as_private():
+    from types import SimpleNamespace
+
+    s = server.GameServer()
+    lines = []
+    s.message = lambda *args: lines.append(args)
+    client = SimpleNamespace(user='opendere')
+    adapter = server.DiscordAdapter(s, client, ['1'])
+
+    def say(channel_id, content, guild=True):
+        author = SimpleNamespace(id=7, display_name='kitties')
+        message = SimpleNamespace(author=author, channel=SimpleNamespace(id=channel_id), guild=guild or None, content=content)
+        asyncio.run(adapter.on_message(message))
+
+    say(1, '!vote n1')
+    say(2, 'vote n1 lol')
+    say(3, 'help', guild=False)
+    assert lines == [('7', 'kitties', '!vote n1', '1'), ('7', 'kitties', 'help', None)]
@@ -0,0 +1,114 @@
+import time
+
+from opendere import server, shard
+
+
+def wait_for(condition, timeout=10):
+    started = time.monotonic()
+    while not condition():
+        assert time.monotonic() - started < timeout
+        time.sleep(0.01)
+
+
+def test_games_run_in_workers():
+    s = shard.ShardedServer(2)
+    local = server.LocalAdapter(s, ['#a', '#b'])
+    s.start()
+    try:
+        for channel in ['#a', '#b']:
+            for i in range(4):
+                local.say(f"{channel}{i}", f"{channel}{i}", '!opendere', channel)
+        wait_for(lambda: len(s.players) == 8)
+        assert s.players['#b3'] == '#b'
+
+        # the front knows #a0 is playing in #a without asking any worker
+        local.say('#a0', '#a0', '!opendere', '#b')
+        assert local.sent[-1] == ('#a0', "you're already playing in the game in #a.")
+
+        # players who change nick or reconnect are moved over by their worker, which tells the front
+        s.nick_change('#b0', '#b0!kitties@host', 'kitties')
+        wait_for(lambda: '#b0!kitties@host' in s.players and '#b0' not in s.players)
+
+        local.say('#a0', '#a0', '!reset', '#a')
+        wait_for(lambda: len(s.players) == 4)
+        wait_for(lambda: ('#a', 'the current game in #a has been ended or reset.') in local.sent)
+    finally:
+        s.stop()
+
+
+def test_front_holds_a_seat_until_the_worker_answers():
+    import multiprocessing
+
+    s = shard.ShardedServer(2)
+    local = server.LocalAdapter(s, ['#a', '#b'])
+    forwarded = []
+    s._send = lambda i, event: forwarded.append(event)
+
+    # the seat is held before any worker has seen the join, so a join on another worker is turned away straight away
+    local.say('kitties', 'kitties', '!opendere', '#a')
+    assert s.players['kitties'] == '#a'
+    local.say('kitties', 'kitties', '!opendere', '#b')
+    assert local.sent[-1] == ('kitties', "you're already playing in the game in #a.")
+    assert [event[4] for event in forwarded] == ['#a']
+    # nor from a new host
+    s.players['p!u@host'] = '#a'
+    s.identities.add('p!u@host')
+    local.say('p!u@phone', 'p', '!opendere', '#b')
+    assert local.sent[-1] == ('p!u@phone', "you're already playing in the game in #a.")
+    assert len(forwarded) == 1
+    del s.players['p!u@host']
+    s.identities.remove('p!u@host')
+
+    # and let go of if the worker says they didn't get in
+    conn, worker_conn = multiprocessing.Pipe()
+    worker_conn.send(('player', 'kitties', None))
+    worker_conn.close()
+    s._listen(conn)
+    assert s.players == {}
+
+
+def test_worker_reports_joins_that_fail():
+    class Conn:
+        def __init__(self):
+            self.sent = []
+
+        def send(self, event):
+            self.sent.append(event)
+
+    conn = Conn()
+    worker_server = shard.WorkerServer(conn)
+    shard.PipeAdapter(worker_server, conn, '#a', 'bot')
+    for i in range(4):
+        worker_server.join(str(i), f"player{i}", '#a')
+    worker_server.games['#a']._phase_change()
+    worker_server.join('late', 'late', '#a')
+
+    assert ('player', '0', '#a') in conn.sent
+    assert conn.sent[-1] == ('player', 'late', None)
+
+
+def test_front_only_routes_a_matching_uid_to_a_seat_its_worker_says_is_empty():
+    import multiprocessing
+
+    s = shard.ShardedServer(2)
+    server.LocalAdapter(s, ['#a'])
+    forwarded = []
+    s._send = lambda i, event: forwarded.append(event)
+
+    def listen(*events):
+        conn, worker_conn = multiprocessing.Pipe()
+        for event in events:
+            worker_conn.send(event)
+        worker_conn.close()
+        s._listen(conn)
+
+    listen(('player', 'p0!u0@host0', '#a'))
+    # p0 is still connected, so someone else on the same host gets nowhere
+    s.message('stranger!u0@host0', 'stranger', 'vote p1')
+    assert forwarded == []
+
+    s.quit('p0!u0@host0')
+    assert forwarded == [('quit', 'p0!u0@host0')]
+    listen(('gone', 'p0!u0@host0'))
+    s.message('p0!u0@phone', 'p0', 'vote p1')
+    assert forwarded[-1] == ('message', 'p0!u0@phone', 'p0', 'vote p1', None, False)
@@ -0,0 +1,20 @@
+import random
+
+from opendere import roles, simulate
+
+
+def test_play_until_someone_wins():
+    g = simulate.play(8, simulate.RandomPolicy(random.Random(1)))
+    assert g.winner in [roles.Alignment.good, roles.Alignment.evil]
+    assert g.num_players_alive < 8
+
+
+def test_chunks_are_reproducible_and_aggregate():
+    stats = simulate.simulate_chunk(7, 20, 4, 6)
+    assert stats == simulate.simulate_chunk(7, 20, 4, 6)
+    assert stats['games'] == 20
+    assert sum(sum(counts.values()) for counts in stats['by_players'].values()) == 20
+
+    summary = simulate.summarize(simulate.merge(simulate.new_stats(), stats))
+    assert summary['games'] == 20
+    assert set(summary['by_players']) <= {4, 5, 6}
@@ -0,0 +1,63 @@
+import json
+
+from opendere import action, game, snapshot
+
+
+def make_game():
+    g = game.Game('#opendere', 'bot', 'opendere')
+    for i in range(7):
+        g.join_game(f"{i}!user@host", f"player{i}")
+    g._phase_change()
+    g._phase_change()
+    users = list(g.users.values())
+    users[2].is_alive = False
+    g.user_action(users[0].uid, '!vote player1', '#opendere')
+    g.user_action(users[3].uid, '!vote player4', '#opendere')
+    g.user_action(users[6].uid, '!vote player1', '#opendere')
+    g.user_action(users[4].uid, '!vote a', '#opendere')
+    g.user_action(users[3].uid, '!vote u', '#opendere')
+    g.phase_actions.append(action.HideAction(g, users[5], None))
+    return g
+
+
+def test_snapshot_round_trip():
+    g = make_game()
+    data = json.loads(json.dumps(snapshot.dump(g)))
+    restored = snapshot.load(data)
+
+    assert snapshot.dump(restored) == {**data, 'time_left': snapshot.dump(restored)['time_left']}
+    assert abs(restored.time_left - g.time_left) < 1
+    assert restored.num_players_alive == g.num_players_alive == 6
+    assert restored.num_yanderes_alive == g.num_yanderes_alive
+    assert restored.list_votes == g.list_votes
+    assert restored.tally_votes().uid == g.tally_votes().uid == '1!user@host'
+
+
+def test_store_saves_loads_and_deletes(tmp_path):
+    store = snapshot.SnapshotStore(tmp_path)
+    g = make_game()
+    store.save(g)
+    (tmp_path / 'broken.json').write_text('{')
+
+    assert [restored.channel for restored in store.load_all()] == ['#opendere']
+    store.delete('#opendere')
+    assert store.load_all() == []
+
+
+def test_load_migrates_v1_snapshots():
+    g = make_game()
+    data = json.loads(json.dumps(snapshot.dump(g)))
+    # what dump() wrote before limited uses were kept track of
+    v1 = {**data, 'v': 1, 'users': [user[:-1] for user in data['users']]}
+    restored = snapshot.load(v1)
+
+    assert snapshot.dump(restored)['users'] == data['users']
+    assert restored.list_votes == g.list_votes
+
+
+def test_load_all_logs_skipped_snapshots(tmp_path, caplog):
+    store = snapshot.SnapshotStore(tmp_path)
+    (tmp_path / 'future.json').write_text('{"v": 99}')
+
+    assert store.load_all() == []
+    assert 'future.json' in caplog.text
@@ -0,0 +1,53 @@
+from opendere import clock, game, vote
+
+
+def test_ledger_tracks_counts_and_leader():
+    ledger = vote.VoteLedger()
+    ledger.vote('a', 'x')
+    ledger.vote('b', 'x')
+    ledger.vote('c', 'y')
+    assert ledger.counts == {'x': 2, 'y': 1}
+    assert ledger.tally() == 'x'
+
+    # changing a vote moves it, ties mean nobody dies
+    ledger.vote('b', 'y')
+    assert ledger.counts == {'x': 1, 'y': 2}
+    ledger.vote('d', None)
+    ledger.vote('e', None)
+    assert sorted(ledger.leaders, key=str) == [None, 'y']
+    assert ledger.tally() is None
+
+    assert ledger.unvote('e') is None
+    assert ledger.abstained == 1
+    assert ledger.tally() == 'y'
+    assert len(ledger) == 4
+
+
+def test_night_ties_go_to_the_first_vote():
+    ledger = vote.VoteLedger(first_vote_breaks_ties=True)
+    ledger.vote('a', None)
+    ledger.vote('b', 'y')
+    ledger.vote('c', 'x')
+    assert ledger.tally() == 'y'
+
+    # the first vote only breaks the tie if it's for one of the leaders
+    ledger = vote.VoteLedger(first_vote_breaks_ties=True)
+    for voter, target in [('a', 'w'), ('b', 'x'), ('c', 'y'), ('d', 'y'), ('e', 'x')]:
+        ledger.vote(voter, target)
+    assert ledger.tally() == 'x'
+
+
+def test_day_votes_through_user_action():
+    c = clock.VirtualClock()
+    g = game.Game('#opendere', 'bot', 'opendere', clock=c)
+    for i in range(4):
+        g.join_game(str(i), f"player{i}")
+    c.advance_to(g.phase_end)
+    g.tick()
+    assert g.phase_name == 'day'
+
+    g.user_action('0', '!vote player1', '#opendere')
+    g.user_action('2', '!vote player1', '#opendere')
+    messages = g.user_action('3', '!vote a', '#opendere')
+    assert messages == [('#opendere', "player3 has voted to abstain. current votes are: player1: 2, abstained: 1, undecided: 1")]
+    assert g.tally_votes() is g.users['1']